@@ -26,6 +26,7 @@ import pecan
 
 from cloudkitty.api import config as api_config
 from cloudkitty.api import hooks
+from cloudkitty.rating import processors as rating_processors
 from cloudkitty import rpc
 from cloudkitty import storage
 
@@ -54,6 +55,10 @@ api_opts = [
     cfg.BoolOpt('pecan_debug',
                 default=False,
                 help='Toggle Pecan Debug Middleware.'),
+    cfg.BoolOpt('local_quote',
+                default=False,
+                help='Compute quotes in the API process instead of sending '
+                     'them to a processor.'),
 ]
 
 CONF = cfg.CONF
@@ -75,9 +80,14 @@ def setup_app(pecan_config=None, extra_hooks=None):
 
     storage_backend = storage.get_storage()
 
+    local_quote = None
+    if CONF.api.local_quote:
+        local_quote = rating_processors.Quoter()
+
     app_hooks = [
         hooks.RPCHook(client),
         hooks.StorageHook(storage_backend),
+        hooks.QuoteHook(local_quote),
     ]
 
     if CONF.auth_strategy == 'keystone':
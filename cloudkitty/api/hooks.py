@@ -37,6 +37,14 @@ class StorageHook(hooks.PecanHook):
         state.request.storage_backend = self._storage_backend
 
 
+class QuoteHook(hooks.PecanHook):
+    def __init__(self, local_quote):
+        self._local_quote = local_quote
+
+    def before(self, state):
+        state.request.local_quote = self._local_quote
+
+
 class ContextHook(hooks.PecanHook):
     def on_route(self, state):
         headers = state.request.headers
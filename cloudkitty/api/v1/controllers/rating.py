@@ -196,7 +196,6 @@ class RatingController(rest.RestController):
         """
         policy.enforce(pecan.request.context, 'rating:quote', {})
 
-        client = pecan.request.rpc_client.prepare(namespace='rating')
         res_dict = {}
         for res in res_data.resources:
             if res.service not in res_dict:
@@ -204,6 +203,10 @@ class RatingController(rest.RestController):
             json_data = res.to_json()
             res_dict[res.service].extend(json_data[res.service])
 
+        local_quote = pecan.request.local_quote
+        if local_quote is not None:
+            return local_quote.quote([{'usage': res_dict}])
+        client = pecan.request.rpc_client.prepare(namespace='rating')
         res = client.call({}, 'quote', res_data=[{'usage': res_dict}])
         return res
 
@@ -17,9 +17,12 @@
 #
 import datetime
 import decimal
+import json
 
 import pecan
 from pecan import rest
+import six
+from wsme.rest import json as wsme_json
 from wsme import types as wtypes
 import wsmeext.pecan as wsme_pecan
 
@@ -29,21 +32,71 @@ from cloudkitty import storage as ck_storage
 from cloudkitty import utils as ck_utils
 
 
+def to_dataframes(frames):
+    """Convert storage frames to DataFrame objects.
+
+    :param frames: Iterable of frames as returned by the storage.
+    """
+    for frame in frames:
+        for service, data_list in frame['usage'].items():
+            frame_tenant = None
+            resources = []
+            for data in data_list:
+                desc = data['desc'] if data['desc'] else {}
+                price = decimal.Decimal(str(data['rating']['price']))
+                resource = storage_models.RatedResource(
+                    service=service,
+                    desc=desc,
+                    volume=data['vol']['qty'],
+                    rating=price)
+                frame_tenant = data['tenant_id']
+                resources.append(resource)
+            yield storage_models.DataFrame(
+                begin=ck_utils.iso2dt(frame['period']['begin']),
+                end=ck_utils.iso2dt(frame['period']['end']),
+                tenant_id=frame_tenant,
+                resources=resources)
+
+
+def stream_dataframes(frames):
+    """Serialize frames to a JSON DataFrameCollection, one at a time.
+
+    :param frames: Iterable of frames as returned by the storage.
+    """
+    yield b'{"dataframes": ['
+    separator = b''
+    for dataframe in to_dataframes(frames):
+        json_frame = json.dumps(
+            wsme_json.tojson(storage_models.DataFrame, dataframe))
+        yield separator + json_frame.encode('utf-8')
+        separator = b', '
+    yield b']}'
+
+
 class DataFramesController(rest.RestController):
     """REST Controller to access stored data frames."""
 
+    _custom_actions = {
+        'stream': ['GET'],
+    }
+
     @wsme_pecan.wsexpose(storage_models.DataFrameCollection,
                          datetime.datetime,
                          datetime.datetime,
                          wtypes.text,
-                         wtypes.text)
-    def get_all(self, begin, end, tenant_id=None, resource_type=None):
+                         wtypes.text,
+                         int,
+                         int)
+    def get_all(self, begin, end, tenant_id=None, resource_type=None,
+                limit=None, marker=None):
         """Return a list of rated resources for a time period and a tenant.
 
         :param begin: Start of the period
         :param end: End of the period
         :param tenant_id: UUID of the tenant to filter on.
         :param resource_type: Type of the resource to filter on.
+        :param limit: Maximum number of data frames to return.
+        :param marker: next_marker of the previous page.
         :return: Collection of DataFrame objects.
         """
 
@@ -52,36 +105,64 @@ class DataFramesController(rest.RestController):
         begin_ts = ck_utils.dt2ts(begin)
         end_ts = ck_utils.dt2ts(end)
         backend = pecan.request.storage_backend
+        if limit is not None:
+            if limit < 1:
+                pecan.abort(400, 'limit must be a positive integer.')
+            frames, next_marker = backend.get_time_frame_page(
+                begin_ts,
+                end_ts,
+                limit,
+                marker,
+                tenant_id=tenant_id,
+                res_type=resource_type)
+            return storage_models.DataFrameCollection(
+                dataframes=list(to_dataframes(frames)),
+                next_marker=next_marker)
         dataframes = []
         try:
-            frames = backend.get_time_frame(begin_ts,
-                                            end_ts,
-                                            tenant_id=tenant_id,
-                                            res_type=resource_type)
-            for frame in frames:
-                for service, data_list in frame['usage'].items():
-                    frame_tenant = None
-                    resources = []
-                    for data in data_list:
-                        desc = data['desc'] if data['desc'] else {}
-                        price = decimal.Decimal(str(data['rating']['price']))
-                        resource = storage_models.RatedResource(
-                            service=service,
-                            desc=desc,
-                            volume=data['vol']['qty'],
-                            rating=price)
-                        frame_tenant = data['tenant_id']
-                        resources.append(resource)
-                    dataframe = storage_models.DataFrame(
-                        begin=ck_utils.iso2dt(frame['period']['begin']),
-                        end=ck_utils.iso2dt(frame['period']['end']),
-                        tenant_id=frame_tenant,
-                        resources=resources)
-                    dataframes.append(dataframe)
+            frames = backend.iter_time_frames(begin_ts,
+                                              end_ts,
+                                              tenant_id=tenant_id,
+                                              res_type=resource_type)
+            dataframes = list(to_dataframes(frames))
         except ck_storage.NoTimeFrame:
             pass
         return storage_models.DataFrameCollection(dataframes=dataframes)
 
+    @pecan.expose(content_type='application/json')
+    def stream(self, begin=None, end=None, tenant_id=None,
+               resource_type=None):
+        """Stream the rated resources for a time period and a tenant.
+
+        The JSON collection is sent while the frames are read from the
+        storage instead of being built in memory.
+
+        :param begin: Start of the period
+        :param end: End of the period
+        :param tenant_id: UUID of the tenant to filter on.
+        :param resource_type: Type of the resource to filter on.
+        """
+
+        policy.enforce(pecan.request.context, 'storage:list_data_frames', {})
+
+        if not begin or not end:
+            pecan.abort(400, 'begin and end are mandatory.')
+        try:
+            begin_ts = ck_utils.dt2ts(ck_utils.iso2dt(begin))
+            end_ts = ck_utils.dt2ts(ck_utils.iso2dt(end))
+        except ValueError as e:
+            pecan.abort(400, six.text_type(e))
+        backend = pecan.request.storage_backend
+        try:
+            frames = backend.iter_time_frames(begin_ts,
+                                              end_ts,
+                                              tenant_id=tenant_id,
+                                              res_type=resource_type)
+        except ck_storage.NoTimeFrame:
+            frames = []
+        pecan.response.app_iter = stream_dataframes(frames)
+        return pecan.response
+
     @wsme_pecan.wsexpose(storage_models.DataFrameCollection,
                          datetime.datetime,
                          datetime.datetime,
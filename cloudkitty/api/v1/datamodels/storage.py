@@ -78,6 +78,9 @@ class DataFrameCollection(wtypes.Base):
 
     dataframes = [DataFrame]
 
+    next_marker = int
+    """Marker to request the next page, null on the last page."""
+
     @classmethod
     def sample(cls):
         sample = DataFrame.sample()
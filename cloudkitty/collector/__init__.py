@@ -47,7 +47,23 @@ collect_opts = [
                          'cloudstorage',
                          'instance.addon',
                          'tenant.addon',],
-                help='Services to monitor.'), ]
+                help='Services to monitor.'),
+    cfg.IntOpt('services_concurrency',
+               default=4,
+               min=1,
+               help='Number of services collected concurrently for a '
+                    'period.'),
+    cfg.IntOpt('service_timeout',
+               default=0,
+               min=0,
+               help='Maximal time in seconds spent collecting a service for '
+                    'a period, 0 to disable. A service which times out is '
+                    'handled as if it returned no data for the period.'),
+    cfg.IntOpt('catchup_periods',
+               default=1,
+               min=1,
+               help='Maximal number of periods collected at once for a '
+                    'lagging tenant, 1 to disable catch-up batching.'), ]
 
 CONF = cfg.CONF
 CONF.register_opts(collect_opts, 'collect')
@@ -148,3 +164,46 @@ class BaseCollector(object):
                 % (self.collector_name, resource))
         func = getattr(self, trans_resource)
         return func(start, end, project_id, q_filter)
+
+    def retrieve_batch(self,
+                       resource,
+                       start,
+                       end,
+                       project_id=None,
+                       q_filter=None):
+        """Retrieve a resource over several consecutive periods.
+
+        Collectors able to fetch a wide timeframe in a single request should
+        override this, the default implementation retrieves every period
+        one after another.
+
+        :param resource: Resource to retrieve.
+        :param start: Beginning of the first period.
+        :param end: End of the last period.
+        :param project_id: Filter on a specific tenant/project.
+        :param q_filter: Append a custom filter.
+        :return: Dict of period beginning to the data returned by retrieve,
+                 periods without data are omitted.
+        """
+        batch = {}
+        for begin in range(start, end, self.period):
+            try:
+                batch[begin] = self.retrieve(resource,
+                                             begin,
+                                             begin + self.period,
+                                             project_id,
+                                             q_filter)
+            except NoDataCollected:
+                pass
+        return batch
+
+    def prefetch(self, start, end, services):
+        """Pre-warm the data of every tenant for a timeframe.
+
+        Collectors able to fetch the data of every tenant at once should
+        override this, the default implementation does nothing.
+
+        :param start: Beginning of the timeframe.
+        :param end: End of the timeframe.
+        :param services: Services to prefetch.
+        """
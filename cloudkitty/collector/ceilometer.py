@@ -15,9 +15,17 @@
 #
 # @author: Stéphane Albert
 #
+import json
+import sqlite3
+import threading
+
 from ceilometerclient import client as cclient
+import eventlet
 from keystoneauth1 import loading as ks_loading
+from oslo_concurrency import lockutils
 from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
 
 from cloudkitty import collector
 from cloudkitty import utils as ck_utils
@@ -29,8 +37,45 @@ ks_loading.register_session_conf_options(
 ks_loading.register_auth_conf_options(
     cfg.CONF,
     CEILOMETER_COLLECTOR_OPTS)
+
+ceilometer_collector_opts = [
+    cfg.IntOpt('resources_fetch_pool_size',
+               default=8,
+               min=1,
+               help='Maximal number of resource details fetched '
+                    'concurrently from ceilometer.'),
+    cfg.IntOpt('resources_cache_size',
+               default=10000,
+               min=0,
+               help='Maximal number of resource details kept in memory, '
+                    '0 disables the in-memory cache.'),
+    cfg.IntOpt('resources_cache_ttl',
+               default=86400,
+               min=1,
+               help='Time to live of the resource details in seconds.'),
+    cfg.DictOpt('resources_cache_ttls',
+                default={},
+                help='Time to live of the resource details per resource '
+                     'type, in seconds. (ex: compute:3600,image:86400)'),
+    cfg.StrOpt('resources_cache_file',
+               help='Path of a sqlite file sharing the resource details '
+                    'between processors and restarts. Disabled if unset.'),
+    cfg.BoolOpt('shared_stats',
+                default=False,
+                help='Query the statistics of every tenant at once for a '
+                     'period instead of once per tenant.'),
+    cfg.IntOpt('shared_stats_cache_size',
+               default=64,
+               min=1,
+               help='Maximal number of (meter, period) statistics of every '
+                    'tenant kept in memory.'),
+]
+cfg.CONF.register_opts(ceilometer_collector_opts, CEILOMETER_COLLECTOR_OPTS)
+
 CONF = cfg.CONF
 
+LOG = logging.getLogger(__name__)
+
 
 class ResourceNotFound(Exception):
     """Raised when the resource doesn't exist."""
@@ -42,34 +87,157 @@ class ResourceNotFound(Exception):
         self.resource_type = resource_type
 
 
+class SQLiteResourceBackend(object):
+    """Resources details stored in a sqlite file.
+
+    The file can be shared by several processors and survives restarts.
+
+    :param path: Path of the sqlite file.
+    """
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path,
+                                     timeout=30,
+                                     check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS resources ('
+                'resource_type TEXT NOT NULL, '
+                'resource_id TEXT NOT NULL, '
+                'timestamp REAL NOT NULL, '
+                'data TEXT NOT NULL, '
+                'PRIMARY KEY (resource_type, resource_id))')
+
+    def get(self, resource_type, resource_id, ttl=None):
+        """Return the insertion timestamp and the details of a resource.
+
+        None is returned if the resource is missing or expired.
+
+        :param resource_type: Type of the resource.
+        :param resource_id: ID of the resource.
+        :param ttl: Time to live of the details in seconds.
+        """
+        row = self._conn.execute(
+            'SELECT timestamp, data FROM resources '
+            'WHERE resource_type = ? AND resource_id = ?',
+            (resource_type, resource_id)).fetchone()
+        if row is None:
+            return
+        timestamp, data = row
+        now = timeutils.utcnow_ts(microsecond=True)
+        if ttl is not None and timestamp + ttl <= now:
+            return
+        return timestamp, json.loads(data)
+
+    def set_many(self, resource_type, resources_data, ttl=None):
+        """Store the details of several resources of the same type.
+
+        Expired resources of this type are purged at the same time.
+
+        :param resource_type: Type of the resources.
+        :param resources_data: Resources details indexed on their IDs.
+        :param ttl: Time to live of the details in seconds.
+        """
+        now = timeutils.utcnow_ts(microsecond=True)
+        rows = [(resource_type, resource_id, now, json.dumps(data))
+                for resource_id, data in resources_data.items()]
+        with self._conn:
+            if ttl is not None:
+                self._conn.execute(
+                    'DELETE FROM resources '
+                    'WHERE resource_type = ? AND timestamp <= ?',
+                    (resource_type, now - ttl))
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO resources '
+                '(resource_type, resource_id, timestamp, data) '
+                'VALUES (?, ?, ?, ?)',
+                rows)
+
+
 class CeilometerResourceCacher(object):
-    def __init__(self):
-        self._resource_cache = {}
+    """Size bounded cache of resources details.
+
+    :param size: Maximal number of resources kept in memory.
+    :param ttl: Default time to live of the details in seconds, None for no
+                expiration.
+    :param ttls: Time to live of the details per resource type.
+    :param backend: Optional backend shared by several cachers.
+    """
+
+    def __init__(self, size=10000, ttl=None, ttls=None, backend=None):
+        self._resource_cache = ck_utils.LRUCache(size, ttl)
+        self._ttls = ttls or {}
+        self._backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def evictions(self):
+        return self._resource_cache.evictions
+
+    def _get_ttl(self, resource_type):
+        return self._ttls.get(resource_type, self._resource_cache.ttl)
+
+    def _lookup(self, resource_type, resource_id):
+        key = (resource_type, resource_id)
+        resource = self._resource_cache.get(key)
+        if resource is None and self._backend:
+            ttl = self._get_ttl(resource_type)
+            entry = self._backend.get(resource_type, resource_id, ttl)
+            if entry is not None:
+                timestamp, resource = entry
+                # NOTE: Keep the expiration of the stored details, they
+                # could be cached forever by cachers loading them in turn.
+                if ttl is not None:
+                    ttl = timestamp + ttl - timeutils.utcnow_ts(
+                        microsecond=True)
+                self._resource_cache.set(key, resource, ttl)
+        return resource
 
     def add_resource_detail(self, resource_type, resource_id, resource_data):
-        if resource_type not in self._resource_cache:
-            self._resource_cache[resource_type] = {}
-        self._resource_cache[resource_type][resource_id] = resource_data
-        return self._resource_cache[resource_type][resource_id]
+        self.add_resources_detail(resource_type, {resource_id: resource_data})
+        return resource_data
+
+    def add_resources_detail(self, resource_type, resources_data):
+        """Add the details of several resources of the same type.
+
+        :param resource_type: Type of the resources.
+        :param resources_data: Resources details indexed on their IDs.
+        """
+        ttl = self._get_ttl(resource_type)
+        for resource_id, resource_data in resources_data.items():
+            self._resource_cache.set((resource_type, resource_id),
+                                     resource_data,
+                                     ttl)
+        if self._backend and resources_data:
+            self._backend.set_many(resource_type, resources_data, ttl)
 
     def has_resource_detail(self, resource_type, resource_id):
-        if resource_type in self._resource_cache:
-            if resource_id in self._resource_cache[resource_type]:
-                return True
-        return False
+        return self._lookup(resource_type, resource_id) is not None
 
     def get_resource_detail(self, resource_type, resource_id):
-        try:
-            resource = self._resource_cache[resource_type][resource_id]
-            return resource
-        except KeyError:
+        resource = self._lookup(resource_type, resource_id)
+        if resource is None:
+            self.misses += 1
             raise ResourceNotFound(resource_type, resource_id)
+        self.hits += 1
+        return resource
 
 
 class CeilometerCollector(collector.BaseCollector):
     collector_name = 'ceilometer'
     dependencies = ('CeilometerTransformer',
                     'CloudKittyFormatTransformer')
+    # Meter queried to collect each service
+    services_meters = {
+        'compute': 'instance',
+        'image': 'image.size',
+        'volume': 'volume.size',
+        'network.bw.in': 'network.incoming.bytes',
+        'network.bw.out': 'network.outgoing.bytes',
+        'network.floating': 'ip.floating',
+        'cloudstorage': 'storage.objects.size',
+        'instance.addon': 'instance'}
 
     def __init__(self, transformers, **kwargs):
         super(CeilometerCollector, self).__init__(transformers, **kwargs)
@@ -77,7 +245,13 @@ class CeilometerCollector(collector.BaseCollector):
         self.t_ceilometer = self.transformers['CeilometerTransformer']
         self.t_cloudkitty = self.transformers['CloudKittyFormatTransformer']
 
-        self._cacher = CeilometerResourceCacher()
+        self._cacher = self._get_cacher()
+        # NOTE: Batch state is local to the (green) thread
+        # collecting a resource.
+        self._batch = threading.local()
+        # Statistics of every tenant indexed on (meter, start, end, filter)
+        self._shared_stats = ck_utils.LRUCache(
+            CONF.ceilometer_collector.shared_stats_cache_size)
 
         self.auth = ks_loading.load_auth_from_conf_options(
             CONF,
@@ -90,6 +264,20 @@ class CeilometerCollector(collector.BaseCollector):
             '2',
             session=self.session)
 
+    @staticmethod
+    def _get_cacher():
+        conf = CONF.ceilometer_collector
+        ttls = dict((resource_type, int(ttl))
+                    for resource_type, ttl
+                    in conf.resources_cache_ttls.items())
+        backend = None
+        if conf.resources_cache_file:
+            backend = SQLiteResourceBackend(conf.resources_cache_file)
+        return CeilometerResourceCacher(conf.resources_cache_size,
+                                        conf.resources_cache_ttl,
+                                        ttls,
+                                        backend)
+
     def gen_filter(self, op='eq', **kwargs):
         """Generate ceilometer filter from kwargs."""
         q_filter = []
@@ -121,13 +309,55 @@ class CeilometerCollector(collector.BaseCollector):
         meta_filter = self.prepend_filter('metadata.', **kwargs)
         return self.gen_filter(op, **meta_filter)
 
-    def resources_stats(self,
-                        meter,
-                        start,
-                        end=None,
-                        project_id=None,
-                        q_filter=None):
-        """Resources statistics during the timespan."""
+    def retrieve_batch(self,
+                       resource,
+                       start,
+                       end,
+                       project_id=None,
+                       q_filter=None):
+        self._batch.window = (start, end)
+        self._batch.stats = {}
+        try:
+            return super(CeilometerCollector, self).retrieve_batch(
+                resource,
+                start,
+                end,
+                project_id,
+                q_filter)
+        finally:
+            self._batch.window = None
+            self._batch.stats = {}
+
+    def _batch_resources_stats(self, meter, start, project_id, q_filter):
+        """Resources statistics of a period, fetched for the whole batch.
+
+        Statistics of every period of the batch window are requested in a
+        single call and split locally on their period beginning.
+        """
+        key = (meter, repr(q_filter))
+        if key not in self._batch.stats:
+            window_start, window_end = self._batch.window
+            stats = self._query_stats(meter,
+                                      window_start,
+                                      window_end,
+                                      project_id,
+                                      q_filter,
+                                      period=self.period)
+            buckets = {}
+            for stat in stats:
+                begin = ck_utils.dt2ts(ck_utils.iso2dt(stat.period_start))
+                buckets.setdefault(begin, []).append(stat)
+            self._batch.stats[key] = buckets
+        return self._batch.stats[key].get(start, [])
+
+    def _query_stats(self,
+                     meter,
+                     start,
+                     end=None,
+                     project_id=None,
+                     q_filter=None,
+                     period=0,
+                     groupby=None):
         start_iso = ck_utils.ts2iso(start)
         req_filter = self.gen_filter(op='ge', timestamp=start_iso)
         if project_id:
@@ -139,11 +369,73 @@ class CeilometerCollector(collector.BaseCollector):
             req_filter.extend(q_filter)
         elif q_filter:
             req_filter.append(q_filter)
-        resources_stats = self._conn.statistics.list(meter_name=meter,
-                                                     period=0, q=req_filter,
-                                                     groupby=['resource_id'])
+        resources_stats = self._conn.statistics.list(
+            meter_name=meter,
+            period=period,
+            q=req_filter,
+            groupby=groupby or ['resource_id'])
         return resources_stats
 
+    def _shared_resources_stats(self, meter, start, end, q_filter):
+        """Resources statistics of every tenant, indexed on their tenant.
+
+        Statistics are fetched in a single call for every tenant and kept
+        for the other workers collecting the same period.
+        """
+        key = (meter, start, end, repr(q_filter))
+        buckets = self._shared_stats.get(key)
+        if buckets is not None:
+            return buckets
+        with lockutils.lock('ceilometer-shared-stats-{}'.format(key)):
+            buckets = self._shared_stats.get(key)
+            if buckets is None:
+                stats = self._query_stats(
+                    meter,
+                    start,
+                    end,
+                    q_filter=q_filter,
+                    groupby=['project_id', 'resource_id'])
+                buckets = {}
+                for stat in stats:
+                    project_id = stat.groupby['project_id']
+                    buckets.setdefault(project_id, []).append(stat)
+                self._shared_stats.set(key, buckets)
+        return buckets
+
+    def prefetch(self, start, end, services):
+        if not CONF.ceilometer_collector.shared_stats:
+            return
+        meters = set(self.services_meters[service]
+                     for service in services
+                     if service in self.services_meters)
+        for meter in meters:
+            try:
+                self._shared_resources_stats(meter, start, end, None)
+            except Exception as e:
+                LOG.warning('Error while prefetching meter %(meter)s: '
+                            '%(error)s', {'meter': meter, 'error': e})
+
+    def resources_stats(self,
+                        meter,
+                        start,
+                        end=None,
+                        project_id=None,
+                        q_filter=None):
+        """Resources statistics during the timespan."""
+        window = getattr(self._batch, 'window', None)
+        if window and end and window[0] <= start and end <= window[1]:
+            return self._batch_resources_stats(meter,
+                                               start,
+                                               project_id,
+                                               q_filter)
+        if CONF.ceilometer_collector.shared_stats and project_id and end:
+            buckets = self._shared_resources_stats(meter,
+                                                   start,
+                                                   end,
+                                                   q_filter)
+            return buckets.get(project_id, [])
+        return self._query_stats(meter, start, end, project_id, q_filter)
+
     def active_resources(self,
                          meter,
                          start,
@@ -159,20 +451,50 @@ class CeilometerCollector(collector.BaseCollector):
         return [resource.groupby['resource_id']
                 for resource in resources_stats]
 
+    def _fetch_resource_detail(self, resource_type, resource_id):
+        raw_resource = self._conn.resources.get(resource_id)
+        return self.t_ceilometer.strip_resource_data(resource_type,
+                                                     raw_resource)
+
+    def get_resources_detail(self, resource_type, resource_ids):
+        """Return the details of resources.
+
+        Details missing from the cache are fetched concurrently from
+        ceilometer and added to the cache at once.
+
+        :param resource_type: Type of the resources.
+        :param resource_ids: IDs of the resources.
+        :return dict: Details of the resources indexed on their IDs.
+        """
+        details = {}
+        missing_ids = []
+        for resource_id in set(resource_ids):
+            try:
+                details[resource_id] = self._cacher.get_resource_detail(
+                    resource_type,
+                    resource_id)
+            except ResourceNotFound:
+                missing_ids.append(resource_id)
+        if not missing_ids:
+            return details
+        pool = eventlet.GreenPool(
+            CONF.ceilometer_collector.resources_fetch_pool_size)
+        resources = pool.imap(
+            lambda resource_id: self._fetch_resource_detail(resource_type,
+                                                            resource_id),
+            missing_ids)
+        fetched = dict(zip(missing_ids, resources))
+        self._cacher.add_resources_detail(resource_type, fetched)
+        details.update(fetched)
+        return details
+
     def get_compute(self, start, end=None, project_id=None, q_filter=None):
         active_instance_ids = self.active_resources('instance', start, end,
                                                     project_id, q_filter)
+        details = self.get_resources_detail('compute', active_instance_ids)
         compute_data = []
         for instance_id in active_instance_ids:
-            if not self._cacher.has_resource_detail('compute', instance_id):
-                raw_resource = self._conn.resources.get(instance_id)
-                instance = self.t_ceilometer.strip_resource_data('compute',
-                                                                 raw_resource)
-                self._cacher.add_resource_detail('compute',
-                                                 instance_id,
-                                                 instance)
-            instance = self._cacher.get_resource_detail('compute',
-                                                        instance_id)
+            instance = details[instance_id]
             compute_data.append(self.t_cloudkitty.format_item(instance,
                                                               'instance',
                                                               1))
@@ -186,18 +508,13 @@ class CeilometerCollector(collector.BaseCollector):
                                                   end,
                                                   project_id,
                                                   q_filter)
+        details = self.get_resources_detail(
+            'image',
+            [stats.groupby['resource_id'] for stats in active_image_stats])
         image_data = []
         for image_stats in active_image_stats:
             image_id = image_stats.groupby['resource_id']
-            if not self._cacher.has_resource_detail('image', image_id):
-                raw_resource = self._conn.resources.get(image_id)
-                image = self.t_ceilometer.strip_resource_data('image',
-                                                              raw_resource)
-                self._cacher.add_resource_detail('image',
-                                                 image_id,
-                                                 image)
-            image = self._cacher.get_resource_detail('image',
-                                                     image_id)
+            image = details[image_id]
 
             # Convert bytes to GB for rate calculation
             image_size_gb = image_stats.max / 1073741824.0
@@ -215,19 +532,13 @@ class CeilometerCollector(collector.BaseCollector):
                                                    end,
                                                    project_id,
                                                    q_filter)
+        details = self.get_resources_detail(
+            'volume',
+            [stats.groupby['resource_id'] for stats in active_volume_stats])
         volume_data = []
         for volume_stats in active_volume_stats:
             volume_id = volume_stats.groupby['resource_id']
-            if not self._cacher.has_resource_detail('volume',
-                                                    volume_id):
-                raw_resource = self._conn.resources.get(volume_id)
-                volume = self.t_ceilometer.strip_resource_data('volume',
-                                                               raw_resource)
-                self._cacher.add_resource_detail('volume',
-                                                 volume_id,
-                                                 volume)
-            volume = self._cacher.get_resource_detail('volume',
-                                                      volume_id)
+            volume = details[volume_id]
             volume_data.append(self.t_cloudkitty.format_item(volume,
                                                              'GB',
                                                              volume_stats.max))
@@ -251,20 +562,13 @@ class CeilometerCollector(collector.BaseCollector):
                                                 end,
                                                 project_id,
                                                 q_filter)
+        details = self.get_resources_detail(
+            'network.tap',
+            [stats.groupby['resource_id'] for stats in active_tap_stats])
         bw_data = []
         for tap_stat in active_tap_stats:
             tap_id = tap_stat.groupby['resource_id']
-            if not self._cacher.has_resource_detail('network.tap',
-                                                    tap_id):
-                raw_resource = self._conn.resources.get(tap_id)
-                tap = self.t_ceilometer.strip_resource_data(
-                    'network.tap',
-                    raw_resource)
-                self._cacher.add_resource_detail('network.tap',
-                                                 tap_id,
-                                                 tap)
-            tap = self._cacher.get_resource_detail('network.tap',
-                                                   tap_id)
+            tap = details[tap_id]
             tap_bw_mb = tap_stat.max / 1048576.0
             bw_data.append(self.t_cloudkitty.format_item(tap,
                                                          'MB',
@@ -300,19 +604,11 @@ class CeilometerCollector(collector.BaseCollector):
                                                     end,
                                                     project_id,
                                                     q_filter)
+        details = self.get_resources_detail('network.floating',
+                                            active_floating_ids)
         floating_data = []
         for floating_id in active_floating_ids:
-            if not self._cacher.has_resource_detail('network.floating',
-                                                    floating_id):
-                raw_resource = self._conn.resources.get(floating_id)
-                floating = self.t_ceilometer.strip_resource_data(
-                    'network.floating',
-                    raw_resource)
-                self._cacher.add_resource_detail('network.floating',
-                                                 floating_id,
-                                                 floating)
-            floating = self._cacher.get_resource_detail('network.floating',
-                                                        floating_id)
+            floating = details[floating_id]
             floating_data.append(self.t_cloudkitty.format_item(floating,
                                                                'ip',
                                                                1))
@@ -330,24 +626,16 @@ class CeilometerCollector(collector.BaseCollector):
                                                    end,
                                                    project_id,
                                                    q_filter)
+        details = self.get_resources_detail(
+            'cloudstorage',
+            [stats.groupby['resource_id']
+             for stats in active_cloud_volume_stats])
         cloud_volume_data = []
 
         for cloud_volume_stats in active_cloud_volume_stats:
 
             cloud_volume_id = cloud_volume_stats.groupby['resource_id']
-            if not self._cacher.has_resource_detail('cloudstorage',
-                                                    cloud_volume_id):
-                raw_resource = self._conn.resources.get(cloud_volume_id)
-
-                cloud_volume = self.t_ceilometer.strip_resource_data('cloudstorage',
-                                                               raw_resource)
-
-                self._cacher.add_resource_detail('cloudstorage',
-                                                 cloud_volume_id,
-                                                 cloud_volume)
-
-            cloud_volume = self._cacher.get_resource_detail('cloudstorage',
-                                                      cloud_volume_id)
+            cloud_volume = details[cloud_volume_id]
 
             # Convert bytes to GB
             cloud_volume_gb = cloud_volume_stats.max / 1073741824.0
@@ -365,19 +653,12 @@ class CeilometerCollector(collector.BaseCollector):
     def get_instance_addon(self, start, end=None, project_id=None, q_filter=None):
         active_instance_ids = self.active_resources('instance', start, end,
                                                     project_id, q_filter)
+        details = self.get_resources_detail('instance.addon',
+                                            active_instance_ids)
 
         instance_addon_data = []
         for instance_id in active_instance_ids:
-            if not self._cacher.has_resource_detail('instance.addon', instance_id):
-                raw_resource = self._conn.resources.get(instance_id)
-
-                instance_addon = self.t_ceilometer.strip_resource_data('instance.addon',
-                                                                 raw_resource)
-                self._cacher.add_resource_detail('instance.addon',
-                                                 instance_id,
-                                                 instance_addon)
-            instance_addon = self._cacher.get_resource_detail('instance.addon',
-                                                        instance_id)
+            instance_addon = details[instance_id]
 
             instance_addon_data.append(self.t_cloudkitty.format_item(instance_addon,
                                                               'instance.addon',
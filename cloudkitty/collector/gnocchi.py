@@ -65,6 +65,7 @@ class GnocchiCollector(collector.BaseCollector):
         'network.bw.out': ('network.outgoing.bytes', 'MB'),
         'network.bw.in': ('network.incoming.bytes', 'MB'),
     }
+    search_page_size = 1000
 
     def __init__(self, transformers, **kwargs):
         super(GnocchiCollector, self).__init__(transformers, **kwargs)
@@ -139,21 +140,128 @@ class GnocchiCollector(collector.BaseCollector):
             if with_revision:
                 time_filter.append(
                     self.gen_filter(cop="<=", revision_start=end))
+                time_filter.append(self.extend_filter(
+                    self.gen_filter(revision_end=None),
+                    self.gen_filter(cop=">=", revision_end=end),
+                    lop='or'))
         return time_filter
 
     def _expand_metrics(self, resources, mappings, start, end=None):
+        """Add the aggregated value of every metric to the resources.
+
+        The measures of a metric are fetched for every resource at once,
+        grouped by resource ID.
+        """
+        if not resources:
+            return
+        resource_ids = [resource['resource_id'] for resource in resources]
+        for name, aggregate in mappings:
+            groups = self._conn.metric.aggregation(
+                metrics=name,
+                query=self.gen_filter(cop='in', id=resource_ids),
+                resource_type='generic',
+                start=start,
+                stop=end,
+                aggregation=aggregate,
+                needed_overlap=0,
+                groupby=['id'])
+            values = {}
+            for group in groups:
+                if group['measures']:
+                    values[group['group']['id']] = group['measures'][0][2]
+            for resource in resources:
+                resource[name] = values.get(resource['resource_id'])
+
+    @staticmethod
+    def _select_revisions(resources):
+        """Keep the latest revision of every resource.
+
+        Revisions are expected to be sorted on their start, newest first.
+        """
+        selected = []
+        seen = set()
         for resource in resources:
-            metrics = resource.get('metrics', {})
-            for name, aggregate in mappings:
-                value = self._conn.metric.get_measures(
-                    metric=metrics.get(name),
-                    start=start,
-                    stop=end,
-                    aggregation=aggregate)
-                try:
-                    resource[name] = value[0][2]
-                except IndexError:
-                    resource[name] = None
+            if resource['id'] not in seen:
+                seen.add(resource['id'])
+                selected.append(resource)
+        return selected
+
+    def _search_pages(self, resource_type, query, history=False, sorts=None):
+        """Search resources page by page.
+
+        Gnocchi caps the number of resources returned by a search, pages
+        are requested until a partial one is returned.
+        """
+        resources = []
+        marker = None
+        while True:
+            page = self._conn.resource.search(
+                resource_type=resource_type,
+                query=query,
+                history=history,
+                limit=self.search_page_size,
+                marker=marker,
+                sorts=sorts)
+            resources.extend(page)
+            if len(page) < self.search_page_size:
+                return resources
+            last = page[-1]
+            marker = last['id']
+            if history and 'revision' in last:
+                marker = '{id}@{revision}'.format(**last)
+
+    def _search_resources(self,
+                          resource_type,
+                          start,
+                          end=None,
+                          resource_id=None,
+                          project_id=None,
+                          q_filter=None):
+        """Search the resources active during the timeframe.
+
+        When the end of the timeframe is set, the revision of the resources
+        valid at the end is returned.
+
+        :return list: Stripped resources data, without their metrics value.
+        """
+        # Translating to resource name if needed
+        translated_resource = self.retrieve_mappings.get(resource_type,
+                                                         resource_type)
+        # NOTE: Only filter revision on history retrieval
+        history = bool(resource_id or end)
+        query_parameters = self._generate_time_filter(
+            start,
+            end,
+            history)
+        search_args = {}
+        if resource_id:
+            query_parameters.append(
+                self.gen_filter(id=resource_id))
+            search_args['limit'] = 1
+        else:
+            if project_id:
+                query_parameters.append(
+                    self.gen_filter(project_id=project_id))
+            if q_filter:
+                query_parameters.append(q_filter)
+        if history:
+            search_args['history'] = True
+            search_args['sorts'] = ['revision_start:desc']
+        query = self.extend_filter(*query_parameters)
+        if resource_id:
+            resources = self._conn.resource.search(
+                resource_type=translated_resource,
+                query=query,
+                **search_args)
+        else:
+            resources = self._search_pages(translated_resource,
+                                           query,
+                                           **search_args)
+        if history:
+            resources = self._select_revisions(resources)
+        return [self.t_gnocchi.strip_resource_data(resource_type,
+                                                   resource)
+                for resource in resources]
 
     def resource_info(self,
                       resource_type,
@@ -176,69 +284,28 @@ class GnocchiCollector(collector.BaseCollector):
         :param q_filter: Append a custom filter.
         :type q_filter: list
         """
-        # Translating to resource name if needed
-        translated_resource = self.retrieve_mappings.get(resource_type,
-                                                         resource_type)
         qty, unit = self.volumes_mappings.get(
             resource_type,
             (1, 'unknown'))
-        # NOTE(sheeprine): Only filter revision on resource retrieval
-        query_parameters = self._generate_time_filter(
-            start,
-            end,
-            True if resource_id else False)
-        need_subquery = True
-        if resource_id:
-            need_subquery = False
-            query_parameters.append(
-                self.gen_filter(id=resource_id))
-            resources = self._conn.resource.search(
-                resource_type=translated_resource,
-                query=self.extend_filter(*query_parameters),
-                history=True,
-                limit=1,
-                sorts=['revision_start:desc'])
-        else:
-            if end:
-                query_parameters.append(
-                    self.gen_filter(cop="=", type=translated_resource))
-            else:
-                need_subquery = False
-            if project_id:
-                query_parameters.append(
-                    self.gen_filter(project_id=project_id))
-            if q_filter:
-                query_parameters.append(q_filter)
-            final_query = self.extend_filter(*query_parameters)
-            resources = self._conn.resource.search(
-                resource_type='generic' if end else translated_resource,
-                query=final_query)
+        resources = self._search_resources(resource_type,
+                                           start,
+                                           end,
+                                           resource_id,
+                                           project_id,
+                                           q_filter)
+        self._expand_metrics(resources,
+                             self.metrics_mappings[resource_type],
+                             start,
+                             end)
         resource_list = list()
-        if not need_subquery:
-            for resource in resources:
-                resource_data = self.t_gnocchi.strip_resource_data(
-                    resource_type,
-                    resource)
-                self._expand_metrics(
-                    [resource_data],
-                    self.metrics_mappings[resource_type],
-                    start,
-                    end)
-                resource_data.pop('metrics', None)
-                data = self.t_cloudkitty.format_item(
-                    resource_data,
-                    unit,
-                    qty if isinstance(qty, int) else resource_data[qty])
-                resource_list.append(data)
-            return resource_list[0] if resource_id else resource_list
-        for resource in resources:
-            res = self.resource_info(
-                resource_type,
-                start,
-                end,
-                resource_id=resource.get('id', ''))
-            resource_list.append(res)
-        return resource_list
+        for resource_data in resources:
+            resource_data.pop('metrics', None)
+            data = self.t_cloudkitty.format_item(
+                resource_data,
+                unit,
+                qty if isinstance(qty, int) else resource_data[qty])
+            resource_list.append(data)
+        return resource_list[0] if resource_id else resource_list
 
     def generic_retrieve(self,
                          resource_name,
@@ -250,8 +317,8 @@ class GnocchiCollector(collector.BaseCollector):
             resource_name,
             start,
             end,
-            project_id,
-            q_filter)
+            project_id=project_id,
+            q_filter=q_filter)
         if not resources:
             raise collector.NoDataCollected(self.collector_name, resource_name)
         for resource in resources:
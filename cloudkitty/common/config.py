@@ -20,6 +20,10 @@ import cloudkitty.api.app
 import cloudkitty.collector
 import cloudkitty.collector.ceilometer
 import cloudkitty.config
+import cloudkitty.orchestrator
+import cloudkitty.rating.hash
+import cloudkitty.rating.processors
+import cloudkitty.rating.pyscripts
 import cloudkitty.service
 import cloudkitty.storage
 import cloudkitty.tenant_fetcher
@@ -30,12 +34,21 @@ __all__ = ['list_opts']
 _opts = [
     ('api', list(itertools.chain(
         cloudkitty.api.app.api_opts,))),
+    ('ceilometer_collector', list(itertools.chain(
+        cloudkitty.collector.ceilometer.ceilometer_collector_opts))),
     ('collect', list(itertools.chain(
         cloudkitty.collector.collect_opts))),
+    ('hashmap', list(itertools.chain(
+        cloudkitty.rating.hash.hashmap_opts))),
     ('keystone_fetcher', list(itertools.chain(
         cloudkitty.tenant_fetcher.keystone.keystone_fetcher_opts))),
+    ('orchestrator', list(itertools.chain(
+        cloudkitty.orchestrator.orchestrator_opts,
+        cloudkitty.rating.processors.quote_opts))),
     ('output', list(itertools.chain(
         cloudkitty.config.output_opts))),
+    ('pyscripts', list(itertools.chain(
+        cloudkitty.rating.pyscripts.pyscripts_opts))),
     ('state', list(itertools.chain(
         cloudkitty.config.state_opts))),
     ('storage', list(itertools.chain(
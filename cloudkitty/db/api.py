@@ -16,6 +16,7 @@
 # @author: Stéphane Albert
 #
 import abc
+import functools
 
 from oslo_config import cfg
 from oslo_db import api as db_api
@@ -111,6 +112,38 @@ class ModuleInfo(ModuleEnableState):
         :param priority: New priority of the module
         """
 
+    @abc.abstractmethod
+    def bump_version(self, name):
+        """Increment the version of the module's rules.
+
+        :param name: Name of the module
+        :return int: New version of the module's rules
+        """
+
+    @abc.abstractmethod
+    def get_versions(self):
+        """Retrieve the state of every module.
+
+        :return dict(str: tuple): State, priority and rules version of
+        every module, indexed on its name.
+        """
+
+
+def bumps_rules_version(module_name):
+    """Bump the rules version of a module after a successful DB write.
+
+    :param module_name: Name of the module owning the rules.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            res = func(*args, **kwargs)
+            module_db = get_instance().get_module_info()
+            module_db.bump_version(module_name)
+            return res
+        return wrapper
+    return decorator
+
 
 class NoSuchMapping(Exception):
     """Raised when the mapping doesn't exist."""
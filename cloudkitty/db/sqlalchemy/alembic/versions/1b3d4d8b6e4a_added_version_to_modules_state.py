@@ -0,0 +1,24 @@
+"""Added version to modules_state.
+
+Revision ID: 1b3d4d8b6e4a
+Revises: 385e33fef139
+Create Date: 2016-04-22 14:12:48.517203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1b3d4d8b6e4a'
+down_revision = '385e33fef139'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('modules_state',
+                  sa.Column('version', sa.Integer(), nullable=False,
+                            server_default='0'))
+
+
+def downgrade():
+    op.drop_column('modules_state', 'version')
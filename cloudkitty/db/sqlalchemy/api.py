@@ -147,6 +147,37 @@ class ModuleInfo(ModuleEnableState):
                 session.add(db_state)
         return int(db_state.priority)
 
+    def bump_version(self, name):
+        session = db.get_session()
+        with session.begin():
+            try:
+                q = utils.model_query(
+                    models.ModuleStateInfo,
+                    session)
+                q = q.filter(
+                    models.ModuleStateInfo.name == name)
+                q = q.with_lockmode('update')
+                db_state = q.one()
+                db_state.version = (db_state.version or 0) + 1
+            except sqlalchemy.orm.exc.NoResultFound:
+                db_state = models.ModuleStateInfo(name=name,
+                                                  version=1)
+                session.add(db_state)
+        return db_state.version
+
+    def get_versions(self):
+        session = db.get_session()
+        q = utils.model_query(
+            models.ModuleStateInfo,
+            session)
+        res = q.values(
+            models.ModuleStateInfo.name,
+            models.ModuleStateInfo.state,
+            models.ModuleStateInfo.priority,
+            models.ModuleStateInfo.version)
+        return dict((name, (state, priority, version))
+                    for name, state, priority, version in res)
+
 
 class ServiceToCollectorMapping(object):
     """Base class for service to collector mapping."""
@@ -63,6 +63,10 @@ class ModuleStateInfo(Base, models.ModelBase):
     priority = sqlalchemy.Column(
         sqlalchemy.Integer(),
         default=1)
+    version = sqlalchemy.Column(
+        sqlalchemy.Integer(),
+        nullable=False,
+        default=0)
 
     def __repr__(self):
         return ('<ModuleStateInfo[{name}]: '
@@ -16,7 +16,6 @@
 #
 # @author: Stéphane Albert
 #
-import decimal
 import random
 import uuid
 
@@ -31,7 +30,7 @@ from tooz import coordination
 from cloudkitty import collector
 from cloudkitty.common import rpc
 from cloudkitty import config  # noqa
-from cloudkitty import extension_manager
+from cloudkitty.rating import processors as rating_processors
 from cloudkitty import storage
 from cloudkitty import transformer
 from cloudkitty import utils as ck_utils
@@ -48,11 +47,19 @@ orchestrator_opts = [
                secret=True,
                help='Coordination driver URL',
                default='file:///var/lib/cloudkitty/locks'),
+    cfg.IntOpt('max_workers',
+               default=1,
+               min=1,
+               help='Maximal number of tenants processed concurrently.'),
+    cfg.IntOpt('heartbeat_interval',
+               default=1,
+               min=1,
+               help='Interval in seconds between two coordination '
+                    'heartbeats.'),
 ]
 CONF.register_opts(orchestrator_opts, group='orchestrator')
 
 FETCHERS_NAMESPACE = 'cloudkitty.tenant.fetchers'
-PROCESSORS_NAMESPACE = 'cloudkitty.rating.processors'
 
 
 class RatingEndpoint(object):
@@ -64,6 +71,7 @@ class RatingEndpoint(object):
         self._pending_reload = []
         self._module_state = {}
         self._orchestrator = orchestrator
+        self._quoter = rating_processors.Quoter()
 
     def get_reload_list(self):
         lock = lockutils.lock('module-reload')
@@ -81,17 +89,20 @@ class RatingEndpoint(object):
 
     def quote(self, ctxt, res_data):
         LOG.debug('Received quote from RPC.')
-        worker = APIWorker()
-        return str(worker.quote(res_data))
+        return self._quoter.quote(res_data)
 
     def reload_modules(self, ctxt):
         LOG.info('Received reload modules command.')
+        rating_processors.processors_cache.clear()
+        self._quoter.reset()
         lock = lockutils.lock('module-reload')
         with lock:
             self._global_reload = True
 
     def reload_module(self, ctxt, name):
         LOG.info('Received reload command for module %s.', name)
+        rating_processors.processors_cache.clear()
+        self._quoter.reset()
         lock = lockutils.lock('module-reload')
         with lock:
             if name not in self._pending_reload:
@@ -112,43 +123,7 @@ class RatingEndpoint(object):
                 self._pending_reload.remove(name)
 
 
-class BaseWorker(object):
-    def __init__(self, tenant_id=None):
-        self._tenant_id = tenant_id
-
-        # Rating processors
-        self._processors = []
-        self._load_rating_processors()
-
-    def _load_rating_processors(self):
-        self._processors = []
-        processors = extension_manager.EnabledExtensionManager(
-            PROCESSORS_NAMESPACE,
-            invoke_kwds={'tenant_id': self._tenant_id})
-
-        for processor in processors:
-            self._processors.append(processor)
-        self._processors.sort(key=lambda x: x.obj.priority, reverse=True)
-
-
-class APIWorker(BaseWorker):
-    def __init__(self, tenant_id=None):
-        super(APIWorker, self).__init__(tenant_id)
-
-    def quote(self, res_data):
-        for processor in self._processors:
-            processor.obj.quote(res_data)
-
-        price = decimal.Decimal(0)
-        for res in res_data:
-            for res_usage in res['usage'].values():
-                for data in res_usage:
-                    price += data.get('rating', {}).get('price',
-                                                        decimal.Decimal(0))
-        return price
-
-
-class Worker(BaseWorker):
+class Worker(rating_processors.BaseWorker):
     def __init__(self, collector, storage, tenant_id=None):
         self._collector = collector
         self._storage = storage
@@ -169,6 +144,98 @@ class Worker(BaseWorker):
                                 'end': next_timestamp},
                      'usage': raw_data}]
 
+    def _collect_batch(self, service, start_timestamp, end_timestamp):
+        raw_batch = self._collector.retrieve_batch(service,
+                                                   start_timestamp,
+                                                   end_timestamp,
+                                                   self._tenant_id)
+        batch = {}
+        for begin, raw_data in raw_batch.items():
+            if raw_data:
+                batch[begin] = [{'period': {'begin': begin,
+                                            'end': begin + self._period},
+                                 'usage': raw_data}]
+        return batch
+
+    def _collect_periods(self, service, start_timestamp, end_timestamp):
+        """Collect a service over consecutive periods.
+
+        Each period can take up to CONF.collect.service_timeout seconds.
+
+        :param service: Service to collect.
+        :param start_timestamp: Beginning of the first period to collect.
+        :param end_timestamp: End of the last period to collect.
+        :return: Dict of period beginning to collected data, periods
+                 without data or which timed out are missing from it.
+        """
+        service_timeout = CONF.collect.service_timeout
+        periods = (end_timestamp - start_timestamp) // self._period
+        if periods > 1:
+            timeout = eventlet.Timeout(service_timeout * periods or None)
+            try:
+                return self._collect_batch(service,
+                                           start_timestamp,
+                                           end_timestamp)
+            except eventlet.Timeout as t:
+                if t is not timeout:
+                    raise
+                LOG.warning(
+                    'Timeout while collecting service %(service)s in '
+                    'batch, falling back to one call per period.',
+                    {'service': service})
+            except Exception as e:
+                LOG.warning(
+                    'Error while collecting service %(service)s in batch, '
+                    'falling back to one call per period: %(error)s',
+                    {'service': service, 'error': e})
+            finally:
+                timeout.cancel()
+        collected = {}
+        for begin in range(start_timestamp, end_timestamp, self._period):
+            timeout = eventlet.Timeout(service_timeout or None)
+            try:
+                data = self._collect(service, begin)
+            except eventlet.Timeout as t:
+                if t is not timeout:
+                    raise
+                LOG.warning(
+                    'Timeout while collecting service %(service)s for the '
+                    'period starting at %(begin)s.',
+                    {'service': service, 'begin': begin})
+                continue
+            except collector.NoDataCollected:
+                continue
+            except Exception as e:
+                LOG.warning(
+                    'Error while collecting service %(service)s: '
+                    '%(error)s', {'service': service, 'error': e})
+                continue
+            finally:
+                timeout.cancel()
+            if data:
+                collected[begin] = data
+        return collected
+
+    def _collect_services(self, start_timestamp, end_timestamp=None):
+        """Collect every configured service concurrently.
+
+        :param start_timestamp: Beginning of the first period to collect.
+        :param end_timestamp: End of the last period to collect, defaults to
+                              a single period.
+        :return: List of (service, data) tuples in the configured service
+                 order. Data is a dict of period beginning to collected data,
+                 periods without data are missing from it.
+        """
+        if end_timestamp is None:
+            end_timestamp = start_timestamp + self._period
+        services = CONF.collect.services
+        pool = eventlet.GreenPool(CONF.collect.services_concurrency)
+        results = pool.imap(self._collect_periods,
+                            services,
+                            [start_timestamp] * len(services),
+                            [end_timestamp] * len(services))
+        return list(zip(services, results))
+
     def check_state(self):
         timestamp = self._storage.get_state(self._tenant_id)
         if not timestamp:
@@ -181,38 +248,51 @@ class Worker(BaseWorker):
             return next_timestamp
         return 0
 
+    def get_catchup_end(self, timestamp):
+        """Return the end of the window to collect in a single pass.
+
+        Lagging tenants are collected in batches of up to
+        CONF.collect.catchup_periods periods, limited to the periods which
+        are already old enough to be collected.
+
+        :param timestamp: Beginning of the first period to collect.
+        """
+        max_periods = CONF.collect.catchup_periods
+        if max_periods > 1:
+            # NOTE: A period can be collected once its beginning
+            # is older than the wait time.
+            available = ck_utils.utcnow_ts() - self._wait_time - timestamp
+            periods = -(-available // self._period)
+            periods = max(1, min(periods, max_periods))
+        else:
+            periods = 1
+        return timestamp + periods * self._period
+
     def run(self):
         while True:
             timestamp = self.check_state()
             if not timestamp:
                 break
 
-            for service in CONF.collect.services:
-                try:
-                    try:
-                        data = self._collect(service, timestamp)
-                    except collector.NoDataCollected:
-                        raise
-                    except Exception as e:
-                        LOG.warning(
-                            'Error while collecting service %(service)s: '
-                            '%(error)s', {'service': service, 'error': e})
-                        raise collector.NoDataCollected('', service)
-                except collector.NoDataCollected:
-                    begin = timestamp
-                    end = begin + self._period
-                    for processor in self._processors:
-                        processor.obj.nodata(begin, end)
-                    self._storage.nodata(begin, end, self._tenant_id)
-                else:
-                    # Rating
-                    for processor in self._processors:
-                        processor.obj.process(data)
-                    # Writing
-                    self._storage.append(data, self._tenant_id)
-
-            # We're getting a full period so we directly commit
-            self._storage.commit(self._tenant_id)
+            end_timestamp = self.get_catchup_end(timestamp)
+            collected = self._collect_services(timestamp, end_timestamp)
+            for begin in range(timestamp, end_timestamp, self._period):
+                for service, batch in collected:
+                    data = batch.get(begin)
+                    if not data:
+                        end = begin + self._period
+                        for processor in self._processors:
+                            processor.obj.nodata(begin, end)
+                        self._storage.nodata(begin, end, self._tenant_id)
+                    else:
+                        # Rating
+                        for processor in self._processors:
+                            processor.obj.process(data)
+                        # Writing
+                        self._storage.append(data, self._tenant_id)
+
+                # We're getting a full period so we directly commit
+                self._storage.commit(self._tenant_id)
 
 
 class Orchestrator(object):
@@ -237,6 +317,21 @@ class Orchestrator(object):
             CONF.orchestrator.coordination_url,
             str(uuid.uuid4()).encode('ascii'))
         self.coord.start()
+        self._heartbeat_thread = eventlet.spawn(self._heartbeat)
+
+        # Workers
+        self._pool = eventlet.GreenPool(CONF.orchestrator.max_workers)
+
+    def _heartbeat(self):
+        # NOTE: Keep the coordinator alive while workers are
+        # holding tenant locks.
+        while True:
+            try:
+                self.coord.heartbeat()
+            except Exception:
+                LOG.exception('Error while sending a coordination '
+                              'heartbeat.')
+            eventlet.sleep(CONF.orchestrator.heartbeat_interval)
 
     def _lock(self, tenant_id):
         lock_name = b"cloudkitty-" + str(tenant_id).encode('ascii')
@@ -269,6 +364,22 @@ class Orchestrator(object):
             return next_timestamp
         return 0
 
+    def _prefetch(self):
+        """Pre-warm the collector with the latest period to collect."""
+        period = CONF.collect.period
+        wait_time = CONF.collect.wait_periods * period
+        month_start = ck_utils.dt2ts(ck_utils.get_month_start())
+        # NOTE: A period is collected once its beginning is
+        # older than the wait time, periods are aligned on the month start.
+        available = ck_utils.utcnow_ts() - wait_time - 1 - month_start
+        start = month_start + available // period * period
+        try:
+            self.collector.prefetch(start,
+                                    start + period,
+                                    CONF.collect.services)
+        except Exception:
+            LOG.exception('Error while prefetching collector data.')
+
     def process_messages(self):
         # TODO(sheeprine): Code kept to handle threading and asynchronous
         # reloading
@@ -276,23 +387,37 @@ class Orchestrator(object):
         # pending_states = self._rating_endpoint.get_module_state()
         pass
 
+    def _process_tenant(self, tenant_id):
+        lock = self._lock(tenant_id)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            if not self._check_state(tenant_id):
+                self._tenants.remove(tenant_id)
+            else:
+                worker = Worker(self.collector,
+                                self.storage,
+                                tenant_id)
+                worker.run()
+        except Exception:
+            LOG.exception('Error while processing tenant %s, skipping it '
+                          'until the next cycle.', tenant_id)
+            # NOTE: The tenant would be retried right away otherwise
+            if tenant_id in self._tenants:
+                self._tenants.remove(tenant_id)
+        finally:
+            lock.release()
+
     def process(self):
         while True:
             self.process_messages()
             self._load_tenant_list()
+            self._prefetch()
             while len(self._tenants):
                 for tenant in self._tenants[:]:
-                    lock = self._lock(tenant)
-                    if lock.acquire(blocking=False):
-                        if not self._check_state(tenant):
-                            self._tenants.remove(tenant)
-                        else:
-                            worker = Worker(self.collector,
-                                            self.storage,
-                                            tenant)
-                            worker.run()
-                        lock.release()
-                    self.coord.heartbeat()
+                    # NOTE: Blocks until a worker slot is free
+                    self._pool.spawn_n(self._process_tenant, tenant)
+                self._pool.waitall()
                 # NOTE(sheeprine): Slow down looping if all tenants are
                 # being processed
                 eventlet.sleep(1)
@@ -300,4 +425,6 @@ class Orchestrator(object):
             eventlet.sleep(CONF.collect.period)
 
     def terminate(self):
+        self._pool.waitall()
+        self._heartbeat_thread.kill()
         self.coord.stop()
@@ -15,12 +15,25 @@
 #
 # @author: Stéphane Albert
 #
+import bisect
 import decimal
 
+from oslo_config import cfg
+
 from cloudkitty import rating
 from cloudkitty.rating.hash.controllers import root as root_api
 from cloudkitty.rating.hash.db import api as hash_db_api
 
+hashmap_opts = [
+    cfg.BoolOpt('batch_processing',
+                default=False,
+                help='Rate the items of a service by groups of items '
+                     'matching the same rules.'),
+]
+cfg.CONF.register_opts(hashmap_opts, 'hashmap')
+
+_NO_VALUE = object()
+
 
 class HashMap(rating.RatingProcessorBase):
     """HashMap rating module.
@@ -39,6 +52,8 @@ class HashMap(rating.RatingProcessorBase):
     def __init__(self, tenant_id=None):
         super(HashMap, self).__init__(tenant_id)
         self._entries = {}
+        self._field_mappings = {}
+        self._sorted_thresholds = {}
         self._res = {}
         self._load_rates()
 
@@ -48,25 +63,36 @@ class HashMap(rating.RatingProcessorBase):
         """
         self._load_rates()
 
+    @staticmethod
+    def _add_mapping(mappings, group_name, value, map_type, cost):
+        current_scope = mappings.setdefault(group_name or '_DEFAULT_', {})
+        if value:
+            current_scope[value] = {}
+            current_scope = current_scope[value]
+        current_scope['type'] = map_type
+        current_scope['cost'] = cost
+
+    @staticmethod
+    def _add_threshold(thresholds, group_name, level, map_type, cost):
+        current_scope = thresholds.setdefault(group_name or '_DEFAULT_', {})
+        current_scope[level] = {}
+        current_scope = current_scope[level]
+        current_scope['type'] = map_type
+        current_scope['cost'] = cost
+
     def _load_mappings(self, mappings_uuid_list):
         hashmap = hash_db_api.get_instance()
         mappings = {}
         for mapping_uuid in mappings_uuid_list:
             mapping_db = hashmap.get_mapping(uuid=mapping_uuid)
+            group_name = None
             if mapping_db.group_id:
                 group_name = mapping_db.group.name
-            else:
-                group_name = '_DEFAULT_'
-            if group_name not in mappings:
-                mappings[group_name] = {}
-            current_scope = mappings[group_name]
-
-            mapping_value = mapping_db.value
-            if mapping_value:
-                current_scope[mapping_value] = {}
-                current_scope = current_scope[mapping_value]
-            current_scope['type'] = mapping_db.map_type
-            current_scope['cost'] = mapping_db.cost
+            self._add_mapping(mappings,
+                              group_name,
+                              mapping_db.value,
+                              mapping_db.map_type,
+                              mapping_db.cost)
         return mappings
 
     def _load_thresholds(self, thresholds_uuid_list):
@@ -74,82 +100,138 @@ class HashMap(rating.RatingProcessorBase):
         thresholds = {}
         for threshold_uuid in thresholds_uuid_list:
             threshold_db = hashmap.get_threshold(uuid=threshold_uuid)
+            group_name = None
             if threshold_db.group_id:
                 group_name = threshold_db.group.name
-            else:
-                group_name = '_DEFAULT_'
-            if group_name not in thresholds:
-                thresholds[group_name] = {}
-            current_scope = thresholds[group_name]
-
-            threshold_level = threshold_db.level
-            current_scope[threshold_level] = {}
-            current_scope = current_scope[threshold_level]
-            current_scope['type'] = threshold_db.map_type
-            current_scope['cost'] = threshold_db.cost
+            self._add_threshold(thresholds,
+                                group_name,
+                                threshold_db.level,
+                                threshold_db.map_type,
+                                threshold_db.cost)
         return thresholds
 
-    def _load_service_entries(self, service_name, service_uuid):
-        hashmap = hash_db_api.get_instance()
-        self._entries[service_name] = {}
-        mappings_uuid_list = hashmap.list_mappings(
-            service_uuid=service_uuid)
-        mappings = self._load_mappings(mappings_uuid_list)
-        self._entries[service_name]['mappings'] = mappings
-        thresholds_uuid_list = hashmap.list_thresholds(
-            service_uuid=service_uuid)
-        thresholds = self._load_thresholds(thresholds_uuid_list)
-        self._entries[service_name]['thresholds'] = thresholds
-
-    def _load_field_entries(self, service_name, field_name, field_uuid):
-        hashmap = hash_db_api.get_instance()
-        mappings_uuid_list = hashmap.list_mappings(field_uuid=field_uuid)
-        mappings = self._load_mappings(mappings_uuid_list)
-        thresholds_uuid_list = hashmap.list_thresholds(field_uuid=field_uuid)
-        thresholds = self._load_thresholds(thresholds_uuid_list)
-        if service_name not in self._entries:
-            self._entries[service_name] = {}
-        if 'fields' not in self._entries[service_name]:
-            self._entries[service_name]['fields'] = {}
-        scope = self._entries[service_name]['fields'][field_name] = {}
-        scope['mappings'] = mappings
-        scope['thresholds'] = thresholds
+    def _get_rules_scope(self, rule):
+        service_scope = self._entries[rule['service']]
+        if rule['field']:
+            return service_scope['fields'][rule['field']]
+        return service_scope
 
     def _load_rates(self):
         self._entries = {}
         hashmap = hash_db_api.get_instance()
-        services_uuid_list = hashmap.list_services()
-        for service_uuid in services_uuid_list:
-            service_db = hashmap.get_service(uuid=service_uuid)
-            service_name = service_db.name
-            self._load_service_entries(service_name, service_uuid)
-            fields_uuid_list = hashmap.list_fields(service_uuid)
-            for field_uuid in fields_uuid_list:
-                field_db = hashmap.get_field(uuid=field_uuid)
-                field_name = field_db.name
-                self._load_field_entries(service_name, field_name, field_uuid)
+        # NOTE: Every rule is fetched at once, instead of one
+        # query per service, field and rule.
+        rates = hashmap.load_rates()
+        for service_name in rates['services']:
+            self._entries[service_name] = {'mappings': {},
+                                           'thresholds': {}}
+        for service_name, field_name in rates['fields']:
+            fields = self._entries[service_name].setdefault('fields', {})
+            fields[field_name] = {'mappings': {},
+                                  'thresholds': {}}
+        for mapping in rates['mappings']:
+            scope = self._get_rules_scope(mapping)
+            self._add_mapping(scope['mappings'],
+                              mapping['group'],
+                              mapping['value'],
+                              mapping['type'],
+                              mapping['cost'])
+        for threshold in rates['thresholds']:
+            scope = self._get_rules_scope(threshold)
+            self._add_threshold(scope['thresholds'],
+                                threshold['group'],
+                                threshold['level'],
+                                threshold['type'],
+                                threshold['cost'])
+        self._compile_mappings()
+        self._compile_thresholds()
 
-    def add_rating_informations(self, data):
-        if 'rating' not in data:
-            data['rating'] = {'price': 0}
+    def _compile_mappings(self):
+        """Index field mappings on (service, field, value).
+
+        Matching a field value is then a single lookup whatever the number
+        of mappings.
+        """
+        self._field_mappings = {}
+        for service_name, service in self._entries.items():
+            for field_name, field in service.get('fields', {}).items():
+                for group_name, mappings in field['mappings'].items():
+                    for mapping_value, mapping in mappings.items():
+                        if not isinstance(mapping, dict):
+                            continue
+                        key = (service_name, field_name, mapping_value)
+                        matches = self._field_mappings.setdefault(key, [])
+                        matches.append((group_name,
+                                        mapping['type'],
+                                        mapping['cost']))
+
+    @staticmethod
+    def _sort_thresholds(threshold_groups):
+        sorted_groups = {}
+        for group_name, thresholds in threshold_groups.items():
+            levels = sorted(thresholds)
+            sorted_groups[group_name] = (
+                levels,
+                [thresholds[level] for level in levels])
+        return sorted_groups
+
+    def _compile_thresholds(self):
+        """Sort thresholds levels per group.
+
+        Thresholds are indexed on (service, field), field being None for
+        service thresholds.
+        """
+        self._sorted_thresholds = {}
+        for service_name, service in self._entries.items():
+            self._sorted_thresholds[(service_name, None)] = (
+                self._sort_thresholds(service.get('thresholds', {})))
+            for field_name, field in service.get('fields', {}).items():
+                self._sorted_thresholds[(service_name, field_name)] = (
+                    self._sort_thresholds(field['thresholds']))
+
+    def get_price_factors(self):
+        """Return the price factors of the current result.
+
+        :return list(tuple): The factor to apply to the quantity, the type
+                             and the cost of the service threshold of every
+                             group.
+        """
+        factors = []
         for entry in self._res.values():
             rate = entry['rate']
             flat = entry['flat']
-            if entry['threshold']['scope'] == 'field':
-                if entry['threshold']['type'] == 'flat':
-                    flat += entry['threshold']['cost']
-                else:
-                    rate *= entry['threshold']['cost']
-            res = rate * flat
-            # FIXME(sheeprine): Added here to ensure that qty is decimal
-            res *= decimal.Decimal(data['vol']['qty'])
-            if entry['threshold']['scope'] == 'service':
-                if entry['threshold']['type'] == 'flat':
-                    res += entry['threshold']['cost']
+            threshold = entry['threshold']
+            if threshold['scope'] == 'field':
+                if threshold['type'] == 'flat':
+                    flat += threshold['cost']
                 else:
-                    res *= entry['threshold']['cost']
+                    rate *= threshold['cost']
+                factors.append((rate * flat, None, None))
+            else:
+                factors.append((rate * flat,
+                                threshold['type'],
+                                threshold['cost']))
+        return factors
+
+    @staticmethod
+    def apply_price_factors(factors, data):
+        if 'rating' not in data:
+            data['rating'] = {'price': 0}
+        if not factors:
+            return
+        # FIXME(sheeprine): Added here to ensure that qty is decimal
+        qty = decimal.Decimal(data['vol']['qty'])
+        for factor, threshold_type, threshold_cost in factors:
+            res = factor * qty
+            if threshold_type == 'flat':
+                res += threshold_cost
+            elif threshold_type is not None:
+                res *= threshold_cost
             data['rating']['price'] += res
 
+    def add_rating_informations(self, data):
+        self.apply_price_factors(self.get_price_factors(), data)
+
     def update_result(self,
                       group,
                       map_type,
@@ -182,30 +264,35 @@ class HashMap(rating.RatingProcessorBase):
                     self._res[group]['flat'] = new_flat
 
     def process_mappings(self,
-                         mapping_groups,
+                         service_name,
+                         field_name,
                          cmp_value):
-        for group_name, mappings in mapping_groups.items():
-            for mapping_value, mapping in mappings.items():
-                if cmp_value == mapping_value:
-                    self.update_result(
-                        group_name,
-                        mapping['type'],
-                        mapping['cost'])
+        try:
+            matches = self._field_mappings.get(
+                (service_name, field_name, cmp_value), [])
+        except TypeError:
+            # NOTE: Unhashable values can't match a mapping value
+            return
+        for group_name, map_type, cost in matches:
+            self.update_result(group_name, map_type, cost)
 
     def process_thresholds(self,
                            threshold_groups,
                            cmp_level,
                            threshold_type):
-        for group_name, thresholds in threshold_groups.items():
-            for threshold_level, threshold in thresholds.items():
-                if cmp_level >= threshold_level:
-                    self.update_result(
-                        group_name,
-                        threshold['type'],
-                        threshold['cost'],
-                        threshold_level,
-                        True,
-                        threshold_type)
+        for group_name, (levels, thresholds) in threshold_groups.items():
+            # Only the highest level lower or equal to cmp_level applies
+            index = bisect.bisect_right(levels, cmp_level) - 1
+            if index < 0:
+                continue
+            threshold = thresholds[index]
+            self.update_result(
+                group_name,
+                threshold['type'],
+                threshold['cost'],
+                levels[index],
+                True,
+                threshold_type)
 
     def process_services(self, service_name, data):
         if service_name not in self._entries:
@@ -215,7 +302,7 @@ class HashMap(rating.RatingProcessorBase):
             self.update_result(group_name,
                                mapping['type'],
                                mapping['cost'])
-        service_thresholds = self._entries[service_name]['thresholds']
+        service_thresholds = self._sorted_thresholds[(service_name, None)]
         self.process_thresholds(service_thresholds,
                                 data['vol']['qty'],
                                 'service')
@@ -231,17 +318,76 @@ class HashMap(rating.RatingProcessorBase):
             if field_name not in desc_data:
                 continue
             cmp_value = desc_data[field_name]
-            self.process_mappings(group_mappings['mappings'],
+            self.process_mappings(service_name,
+                                  field_name,
                                   cmp_value)
             if group_mappings['thresholds']:
-                self.process_thresholds(group_mappings['thresholds'],
+                field_thresholds = self._sorted_thresholds[
+                    (service_name, field_name)]
+                self.process_thresholds(field_thresholds,
                                         decimal.Decimal(cmp_value),
                                         'field')
 
+    def _get_batch_key(self, service_name, data):
+        """Return the values the rules matched by an item depend on.
+
+        Items with the same key match the same rules and only differ by
+        their quantity.
+        """
+        if service_name not in self._entries:
+            return ()
+        desc_data = data['desc']
+        key = []
+        for field_name in self._entries[service_name].get('fields', {}):
+            key.append(desc_data.get(field_name, _NO_VALUE))
+        service_thresholds = self._sorted_thresholds[(service_name, None)]
+        for levels, thresholds in service_thresholds.values():
+            key.append(bisect.bisect_right(levels, data['vol']['qty']))
+        return tuple(key)
+
+    def process_batch(self, service_name, service_data):
+        """Rate every item of a service.
+
+        Rules are matched once per group of items sharing the same key.
+
+        :param service_name: Name of the service.
+        :param service_data: Items of the service.
+        """
+        batches = {}
+        for item in service_data:
+            key = self._get_batch_key(service_name, item)
+            try:
+                batches.setdefault(key, []).append(item)
+            except TypeError:
+                # NOTE: Unhashable values are rated on their own
+                batches.setdefault((_NO_VALUE, id(item)), []).append(item)
+        for items in batches.values():
+            self._res = {}
+            self.process_services(service_name, items[0])
+            self.process_fields(service_name, items[0])
+            factors = self.get_price_factors()
+            prices = {}
+            for item in items:
+                if not factors or 'rating' in item:
+                    self.apply_price_factors(factors, item)
+                    continue
+                # NOTE: The exact decimal representation is
+                # used as key to return the same price than a single item.
+                qty = decimal.Decimal(item['vol']['qty']).as_tuple()
+                if qty not in prices:
+                    self.apply_price_factors(factors, item)
+                    prices[qty] = item['rating']['price']
+                else:
+                    item['rating'] = {'price': prices[qty]}
+
     def process(self, data):
+        batch_processing = cfg.CONF.hashmap.batch_processing
         for cur_data in data:
             cur_usage = cur_data['usage']
             for service_name, service_data in cur_usage.items():
+                if batch_processing:
+                    self.process_batch(service_name, service_data)
+                    continue
                 for item in service_data:
                     self._res = {}
                     self.process_services(service_name, item)
@@ -256,6 +256,18 @@ class HashMap(object):
         :return list(str): List of thresholds' UUID.
         """
 
+    @abc.abstractmethod
+    def load_rates(self):
+        """Return every rating rule in a few queries.
+
+        :return dict: 'services' is a list of service names, 'fields' a
+                      list of (service name, field name), 'mappings' and
+                      'thresholds' are lists of dicts with the service,
+                      field and group names, the value or level, the
+                      map type and the cost of each rule. Field and group
+                      are None when the rule is not attached to them.
+        """
+
     @abc.abstractmethod
     def create_service(self, name):
         """Create a new service.
@@ -20,8 +20,10 @@ from oslo_db.sqlalchemy import utils
 from oslo_utils import uuidutils
 import six
 import sqlalchemy
+from sqlalchemy import orm
 
 from cloudkitty import db
+from cloudkitty.db import api as ck_db_api
 from cloudkitty.rating.hash.db import api
 from cloudkitty.rating.hash.db.sqlalchemy import migration
 from cloudkitty.rating.hash.db.sqlalchemy import models
@@ -217,6 +219,67 @@ class HashMap(api.HashMap):
             models.HashMapThreshold.threshold_id)
         return [uuid[0] for uuid in res]
 
+    def _load_rules(self, session, model, rule_key):
+        field_service = orm.aliased(models.HashMapService)
+        q = session.query(
+            models.HashMapService.name,
+            field_service.name,
+            models.HashMapField.name,
+            models.HashMapGroup.name,
+            getattr(model, rule_key),
+            model.map_type,
+            model.cost)
+        q = q.select_from(model)
+        q = q.outerjoin(
+            models.HashMapService,
+            model.service_id == models.HashMapService.id)
+        q = q.outerjoin(
+            models.HashMapField,
+            model.field_id == models.HashMapField.id)
+        q = q.outerjoin(
+            field_service,
+            models.HashMapField.service_id == field_service.id)
+        q = q.outerjoin(
+            models.HashMapGroup,
+            model.group_id == models.HashMapGroup.id)
+        rules = []
+        for (service, field_service_name, field, group,
+             key, map_type, cost) in q:
+            rules.append({
+                'service': service or field_service_name,
+                'field': field,
+                'group': group,
+                rule_key: key,
+                'type': map_type,
+                'cost': cost})
+        return rules
+
+    def load_rates(self):
+        session = db.get_session()
+        q = session.query(models.HashMapService.name)
+        services = [service[0] for service in q]
+        q = session.query(
+            models.HashMapService.name,
+            models.HashMapField.name)
+        q = q.select_from(models.HashMapField)
+        q = q.join(
+            models.HashMapService,
+            models.HashMapField.service_id == models.HashMapService.id)
+        fields = [(field[0], field[1]) for field in q]
+        mappings = self._load_rules(
+            session,
+            models.HashMapMapping,
+            'value')
+        thresholds = self._load_rules(
+            session,
+            models.HashMapThreshold,
+            'level')
+        return {'services': services,
+                'fields': fields,
+                'mappings': mappings,
+                'thresholds': thresholds}
+
+    @ck_db_api.bumps_rules_version('hashmap')
     def create_service(self, name):
         session = db.get_session()
         try:
@@ -231,6 +294,7 @@ class HashMap(api.HashMap):
                 service_db.name,
                 service_db.service_id)
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def create_field(self, service_uuid, name):
         service_db = self.get_service(uuid=service_uuid)
         session = db.get_session()
@@ -250,6 +314,7 @@ class HashMap(api.HashMap):
         else:
             return field_db
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def create_group(self, name):
         session = db.get_session()
         try:
@@ -262,6 +327,7 @@ class HashMap(api.HashMap):
         except exception.DBDuplicateEntry:
             raise api.GroupAlreadyExists(name, group_db.group_id)
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def create_mapping(self,
                        cost,
                        map_type='rate',
@@ -311,6 +377,7 @@ class HashMap(api.HashMap):
         field_map = self.get_mapping(field_map.mapping_id)
         return field_map
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def create_threshold(self,
                          level,
                          cost,
@@ -354,6 +421,7 @@ class HashMap(api.HashMap):
         threshold_db = self.get_threshold(threshold_db.threshold_id)
         return threshold_db
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def update_mapping(self, uuid, **kwargs):
         session = db.get_session()
         try:
@@ -387,6 +455,7 @@ class HashMap(api.HashMap):
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchMapping(uuid)
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def update_threshold(self, uuid, **kwargs):
         session = db.get_session()
         try:
@@ -419,6 +488,7 @@ class HashMap(api.HashMap):
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchThreshold(uuid)
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def delete_service(self, name=None, uuid=None):
         session = db.get_session()
         q = utils.model_query(
@@ -434,6 +504,7 @@ class HashMap(api.HashMap):
         if not r:
             raise api.NoSuchService(name, uuid)
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def delete_field(self, uuid):
         session = db.get_session()
         q = utils.model_query(
@@ -444,6 +515,7 @@ class HashMap(api.HashMap):
         if not r:
             raise api.NoSuchField(uuid)
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def delete_group(self, uuid, recurse=True):
         session = db.get_session()
         q = utils.model_query(
@@ -462,6 +534,7 @@ class HashMap(api.HashMap):
                     session.delete(threshold)
             q.delete()
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def delete_mapping(self, uuid):
         session = db.get_session()
         q = utils.model_query(
@@ -472,6 +545,7 @@ class HashMap(api.HashMap):
         if not r:
             raise api.NoSuchMapping(uuid)
 
+    @ck_db_api.bumps_rules_version('hashmap')
     def delete_threshold(self, uuid):
         session = db.get_session()
         q = utils.model_query(
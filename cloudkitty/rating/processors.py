@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# @author: Stéphane Albert
+#
+"""Rating processors loading and quoting.
+
+Shared by the processor and the API, this module must not monkey patch the
+process.
+"""
+import decimal
+import hashlib
+import json
+
+from oslo_concurrency import lockutils
+from oslo_config import cfg
+
+from cloudkitty.db import api as db_api
+from cloudkitty import extension_manager
+from cloudkitty import utils as ck_utils
+
+CONF = cfg.CONF
+
+quote_opts = [
+    cfg.IntOpt('quote_cache_size',
+               default=1024,
+               min=0,
+               help='Maximal number of quotes cached, 0 disables the '
+                    'cache.'),
+    cfg.IntOpt('quote_cache_ttl',
+               default=300,
+               min=1,
+               help='Time to live in seconds of a cached quote.'),
+]
+CONF.register_opts(quote_opts, group='orchestrator')
+
+PROCESSORS_NAMESPACE = 'cloudkitty.rating.processors'
+
+
+class RatingProcessorsCache(object):
+    """Process-wide cache of the loaded rating processors.
+
+    Processors are kept until the version of the modules (state, priority
+    and rules version) stored in the database changes.
+    """
+
+    def __init__(self):
+        self._version = None
+        self._processors = None
+
+    def get(self, version):
+        """Return the cached processors if they match the version.
+
+        :param version: Current version of the modules.
+        """
+        if self._processors is not None and self._version == version:
+            return self._processors
+
+    def set(self, version, processors):
+        self._version = version
+        self._processors = processors
+
+    def clear(self):
+        # NOTE: Wait for a pending load, its processors would be cached
+        # after being cleared otherwise.
+        lock = lockutils.lock('rating-processors')
+        with lock:
+            self._version = None
+            self._processors = None
+
+
+processors_cache = RatingProcessorsCache()
+
+
+class BaseWorker(object):
+    def __init__(self, tenant_id=None):
+        self._tenant_id = tenant_id
+
+        # Rating processors
+        self._processors = []
+        self._load_rating_processors()
+
+    def _load_rating_processors(self):
+        module_db = db_api.get_instance().get_module_info()
+        version = module_db.get_versions()
+        lock = lockutils.lock('rating-processors')
+        with lock:
+            processors = processors_cache.get(version)
+            if processors is None:
+                # NOTE: Processors are shared between every worker of
+                # the process, none of them is tenant specific. Workers can
+                # switch while a processor waits on I/O (e.g. PyScripts
+                # waiting for its process pool), processors must not keep
+                # state of a processing across such a wait.
+                manager = extension_manager.EnabledExtensionManager(
+                    PROCESSORS_NAMESPACE,
+                    invoke_kwds={'tenant_id': None})
+                processors = sorted(manager,
+                                    key=lambda x: x.obj.priority,
+                                    reverse=True)
+                processors_cache.set(version, processors)
+        self._processors = list(processors)
+
+
+class APIWorker(BaseWorker):
+    def __init__(self, tenant_id=None):
+        super(APIWorker, self).__init__(tenant_id)
+
+    def quote(self, res_data):
+        for processor in self._processors:
+            processor.obj.quote(res_data)
+
+        price = decimal.Decimal(0)
+        for res in res_data:
+            for res_usage in res['usage'].values():
+                for data in res_usage:
+                    price += data.get('rating', {}).get('price',
+                                                        decimal.Decimal(0))
+        return price
+
+
+class Quoter(object):
+    """Compute quotes with a long-lived APIWorker.
+
+    Quotes are cached until the version of the modules changes or the
+    quoter is reset.
+    """
+
+    def __init__(self):
+        self._quote_cache = ck_utils.LRUCache(
+            CONF.orchestrator.quote_cache_size,
+            CONF.orchestrator.quote_cache_ttl)
+        self._worker = None
+        self._worker_version = None
+
+    @staticmethod
+    def _get_quote_key(res_data):
+        data = json.dumps(res_data, sort_keys=True, default=str)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def reset(self):
+        lock = lockutils.lock('quote')
+        with lock:
+            self._quote_cache.clear()
+            self._worker = None
+
+    def quote(self, res_data):
+        """Return the price of the resources as a string.
+
+        :param res_data: An internal CloudKitty list of periods describing
+                         the resources to quote.
+        """
+        module_db = db_api.get_instance().get_module_info()
+        version = module_db.get_versions()
+        key = self._get_quote_key(res_data)
+        # NOTE: The worker's processors are not used by two quotes at once.
+        lock = lockutils.lock('quote')
+        with lock:
+            # NOTE: Rating rules changed, cached quotes and
+            # processors are outdated.
+            if self._worker is None or self._worker_version != version:
+                self._quote_cache.clear()
+                self._worker = APIWorker()
+                self._worker_version = version
+            price = self._quote_cache.get(key)
+            if price is None:
+                price = str(self._worker.quote(res_data))
+                self._quote_cache.set(key, price)
+        return price
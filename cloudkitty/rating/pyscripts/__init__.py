@@ -15,9 +15,50 @@
 #
 # @author: Stéphane Albert
 #
+from oslo_config import cfg
+from oslo_log import log as logging
+
 from cloudkitty import rating
 from cloudkitty.rating.pyscripts.controllers import root as root_api
 from cloudkitty.rating.pyscripts.db import api as pyscripts_db_api
+from cloudkitty.rating.pyscripts import pool
+
+LOG = logging.getLogger(__name__)
+
+pyscripts_opts = [
+    cfg.IntOpt('process_pool_size',
+               default=0,
+               min=0,
+               help='Number of worker processes executing the scripts, '
+                    '0 executes them in the processor.'),
+    cfg.IntOpt('cpu_time_limit',
+               default=60,
+               min=1,
+               help='CPU time limit in seconds of every script executed '
+                    'by a worker process.'),
+    cfg.IntOpt('wall_time_limit',
+               default=300,
+               min=1,
+               help='Wall-clock time limit in seconds of every script '
+                    'executed by a worker process, the worker is killed when '
+                    'it is exceeded.'),
+]
+cfg.CONF.register_opts(pyscripts_opts, 'pyscripts')
+
+_POOL = None
+
+
+def get_pool():
+    """Return the process pool or None if it's disabled."""
+    global _POOL
+    size = cfg.CONF.pyscripts.process_pool_size
+    if not size:
+        return
+    if _POOL is None:
+        _POOL = pool.ScriptsPool(size,
+                                 cfg.CONF.pyscripts.cpu_time_limit,
+                                 cfg.CONF.pyscripts.wall_time_limit)
+    return _POOL
 
 
 class PyScripts(rating.RatingProcessorBase):
@@ -36,38 +77,52 @@ class PyScripts(rating.RatingProcessorBase):
 
     def __init__(self, tenant_id=None):
         self._scripts = {}
+        self._functions = {}
+        self._sources = {}
+        # Number of scripts compiled since the module was loaded
+        self.compiled_scripts = 0
         self.load_scripts_in_memory()
         super(PyScripts, self).__init__(tenant_id)
 
     def load_scripts_in_memory(self):
+        """Load new and updated scripts, purge deleted ones.
+
+        :return int: Number of scripts compiled.
+        """
         db = pyscripts_db_api.get_instance()
-        scripts_uuid_list = db.list_scripts()
+        scripts_db = dict((script_db.script_id, script_db)
+                          for script_db in db.get_scripts())
         # Purge old entries
-        scripts_to_purge = []
-        for script_uuid in self._scripts.keys():
-            if script_uuid not in scripts_uuid_list:
-                scripts_to_purge.append(script_uuid)
-        for script_uuid in scripts_to_purge:
-            del self._scripts[script_uuid]
+        for script_uuid in list(self._scripts):
+            if script_uuid not in scripts_db:
+                del self._scripts[script_uuid]
         # Load or update script
-        for script_uuid in scripts_uuid_list:
-            script_db = db.get_script(uuid=script_uuid)
+        compiled = 0
+        for script_uuid, script_db in scripts_db.items():
             name = script_db.name
             checksum = script_db.checksum
-            if name not in self._scripts:
-                self._scripts[script_uuid] = {}
-            script = self._scripts[script_uuid]
-            # NOTE(sheeprine): We're doing this the easy way, we might want to
-            # store the context and call functions in future
-            if script.get(checksum, '') != checksum:
-                code = compile(
-                    script_db.data,
-                    '<PyScripts: {name}>'.format(name=name),
-                    'exec')
-                script.update({
+            script = self._scripts.get(script_uuid, {})
+            loaded = (script.get('name'), script.get('checksum'))
+            if loaded != (name, checksum):
+                code, function = pool.compile_script(name, script_db.data)
+                compiled += 1
+                self._scripts[script_uuid] = {
                     'name': name,
                     'code': code,
-                    'checksum': checksum})
+                    'checksum': checksum}
+                self._sources[checksum] = script_db.data
+                if function:
+                    self._functions[checksum] = function
+        # Purge functions of old scripts
+        checksums = [script['checksum'] for script in self._scripts.values()]
+        for checksum in list(self._sources):
+            if checksum not in checksums:
+                del self._sources[checksum]
+                self._functions.pop(checksum, None)
+        self.compiled_scripts += compiled
+        if compiled:
+            LOG.info('PyScripts: %d script(s) compiled.', compiled)
+        return compiled
 
     def reload_config(self):
         """Reload the module's configuration.
@@ -81,6 +136,19 @@ class PyScripts(rating.RatingProcessorBase):
         return data
 
     def process(self, data):
+        scripts_pool = get_pool()
+        if scripts_pool:
+            scripts = [(script['checksum'],
+                        script['name'],
+                        self._sources[script['checksum']])
+                       for script in self._scripts.values()]
+            if scripts:
+                data[:] = scripts_pool.process(scripts, data)
+            return data
         for script in self._scripts.values():
-            self.start_script(script['code'], data)
+            function = self._functions.get(script['checksum'])
+            if function:
+                function(data)
+            else:
+                self.start_script(script['code'], data)
         return data
@@ -77,6 +77,12 @@ class PyScripts(object):
 
         """
 
+    @abc.abstractmethod
+    def get_scripts(self):
+        """Return every script object in a single query.
+
+        """
+
     @abc.abstractmethod
     def create_script(self, name, data):
         """Create a new script.
@@ -22,6 +22,7 @@ import six
 import sqlalchemy
 
 from cloudkitty import db
+from cloudkitty.db import api as ck_db_api
 from cloudkitty.rating.pyscripts.db import api
 from cloudkitty.rating.pyscripts.db.sqlalchemy import migration
 from cloudkitty.rating.pyscripts.db.sqlalchemy import models
@@ -60,6 +61,12 @@ class PyScripts(api.PyScripts):
             models.PyScriptsScript.script_id)
         return [uuid[0] for uuid in res]
 
+    def get_scripts(self):
+        session = db.get_session()
+        q = session.query(models.PyScriptsScript)
+        return q.all()
+
+    @ck_db_api.bumps_rules_version('pyscripts')
     def create_script(self, name, data):
         session = db.get_session()
         try:
@@ -75,6 +82,7 @@ class PyScripts(api.PyScripts):
                 script_db.name,
                 script_db.script_id)
 
+    @ck_db_api.bumps_rules_version('pyscripts')
     def update_script(self, uuid, **kwargs):
         session = db.get_session()
         try:
@@ -101,6 +109,7 @@ class PyScripts(api.PyScripts):
         except sqlalchemy.orm.exc.NoResultFound:
             raise api.NoSuchScript(uuid=uuid)
 
+    @ck_db_api.bumps_rules_version('pyscripts')
     def delete_script(self, name=None, uuid=None):
         session = db.get_session()
         q = utils.model_query(
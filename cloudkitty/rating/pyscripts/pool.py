@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# @author: Stéphane Albert
+#
+"""Process pool executing PyScripts scripts.
+
+Scripts run in child processes running this module's main function.
+Requests and results are pickled and sent over the child's stdin and
+stdout, prefixed by their length.
+"""
+import ast
+import signal
+import struct
+import sys
+
+import eventlet
+from eventlet.green import subprocess
+from eventlet import queue
+from six.moves import cPickle as pickle
+
+_HEADER = struct.Struct('!I')
+
+
+class ScriptError(Exception):
+    """Raised when a script failed in a worker process."""
+
+
+class ScriptTimeout(ScriptError):
+    """Raised when a script exceeded its CPU time limit."""
+
+
+class WorkerDied(ScriptError):
+    """Raised when a worker process exited unexpectedly."""
+
+
+def compile_script(name, data):
+    """Compile a script and load its process function.
+
+    A script defining a top-level process function is executed once in its
+    own namespace, its process function is then called directly for every
+    processing. As for a whole script, only the changes made in place to
+    the data are kept, the value returned by the function is ignored.
+    Scripts which can't be executed without data (e.g. calling process on
+    data at top-level) are executed as a whole for every processing.
+
+    :param name: Name of the script.
+    :param data: Source of the script.
+    :return tuple: The code of the script and its process function or None
+                   if the script doesn't define one.
+    """
+    code = compile(
+        data,
+        '<PyScripts: {name}>'.format(name=name),
+        'exec')
+    tree = ast.parse(data)
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == 'process':
+            break
+    else:
+        return code, None
+    context = {}
+    try:
+        exec(code, context)
+    except Exception:
+        return code, None
+    function = context.get('process')
+    if not callable(function):
+        return code, None
+    return code, function
+
+
+def run_script(code, function, data):
+    if function:
+        function(data)
+    else:
+        context = {'data': data}
+        exec(code, context)
+    return data
+
+
+def _write_message(stream, message):
+    payload = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(payload)))
+    stream.write(payload)
+    stream.flush()
+
+
+def _read_exactly(stream, size):
+    chunks = []
+    while size:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _read_message(stream):
+    header = _read_exactly(stream, _HEADER.size)
+    if header is None:
+        return
+    payload = _read_exactly(stream, _HEADER.unpack(header)[0])
+    if payload is None:
+        return
+    return pickle.loads(payload)
+
+
+def _raise_timeout(signum, frame):
+    raise ScriptTimeout('CPU time limit exceeded.')
+
+
+def _get_streams():
+    if sys.version_info[0] > 2:
+        return sys.stdin.buffer, sys.stdout.buffer
+    return sys.stdin, sys.stdout
+
+
+def main():
+    stdin, stdout = _get_streams()
+    # NOTE: Scripts printing on stdout would corrupt the results
+    sys.stdout = sys.stderr
+    signal.signal(signal.SIGPROF, _raise_timeout)
+    scripts = {}
+    while True:
+        message = _read_message(stdin)
+        if message is None:
+            break
+        scripts_list, data, cpu_time_limit = message
+        try:
+            for checksum, name, script_data in scripts_list:
+                if checksum not in scripts:
+                    scripts[checksum] = compile_script(name, script_data)
+            for checksum, name, script_data in scripts_list:
+                code, function = scripts[checksum]
+                signal.setitimer(signal.ITIMER_PROF, cpu_time_limit)
+                try:
+                    run_script(code, function, data)
+                finally:
+                    signal.setitimer(signal.ITIMER_PROF, 0)
+            result = (None, None, data)
+        except ScriptTimeout as e:
+            result = ('timeout',
+                      '{name}: {err}'.format(name=name, err=e),
+                      None)
+        except Exception as e:
+            result = ('error',
+                      '{name}: {type}: {err}'.format(
+                          name=name,
+                          type=type(e).__name__,
+                          err=e),
+                      None)
+        # Purge old scripts
+        checksums = [script[0] for script in scripts_list]
+        for checksum in list(scripts):
+            if checksum not in checksums:
+                del scripts[checksum]
+        _write_message(stdout, result)
+
+
+class ScriptsWorker(object):
+    """Worker process executing scripts."""
+
+    def __init__(self):
+        # NOTE: Running the module with -m would import it twice in the
+        # child, as the cloudkitty.rating.pyscripts package imports it.
+        self._process = subprocess.Popen(
+            [sys.executable,
+             '-c',
+             'from cloudkitty.rating.pyscripts import pool; pool.main()'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        # Checksums of the scripts already sent to the worker
+        self._known_scripts = set()
+
+    @property
+    def alive(self):
+        return self._process.returncode is None
+
+    def process(self, scripts, data, cpu_time_limit, wall_time_limit):
+        """Execute scripts on data in the worker process.
+
+        The worker is killed if the scripts exceed their wall-clock time
+        limit, e.g. while sleeping or waiting on I/O.
+
+        :param scripts: List of (checksum, name, data) of the scripts.
+        :param data: Data to rate.
+        :param cpu_time_limit: CPU time limit of each script in seconds.
+        :param wall_time_limit: Wall-clock time limit of each script in
+                                seconds.
+        :return: Rated data.
+        """
+        scripts_list = []
+        for checksum, name, script_data in scripts:
+            if checksum in self._known_scripts:
+                script_data = None
+            scripts_list.append((checksum, name, script_data))
+        timeout = eventlet.Timeout(wall_time_limit * len(scripts))
+        try:
+            _write_message(self._process.stdin,
+                           (scripts_list, data, cpu_time_limit))
+            result = _read_message(self._process.stdout)
+        except eventlet.Timeout as t:
+            if t is not timeout:
+                raise
+            self.kill()
+            raise ScriptTimeout('Wall-clock time limit exceeded.')
+        except (IOError, OSError):
+            result = None
+        finally:
+            timeout.cancel()
+        if result is None:
+            self.stop()
+            raise WorkerDied('PyScripts worker exited.')
+        error, msg, data = result
+        if error:
+            # NOTE: The worker might not have loaded every script
+            self._known_scripts = set()
+            if error == 'timeout':
+                raise ScriptTimeout(msg)
+            raise ScriptError(msg)
+        self._known_scripts = set(script[0] for script in scripts)
+        return data
+
+    def stop(self):
+        try:
+            self._process.stdin.close()
+        except (IOError, OSError):
+            pass
+        self._process.wait()
+
+    def kill(self):
+        self._process.kill()
+        self.stop()
+
+
+class ScriptsPool(object):
+    """Pool of worker processes executing scripts.
+
+    Workers are started on demand, a green thread waiting for a result
+    doesn't block the other ones.
+    """
+
+    def __init__(self, size, cpu_time_limit, wall_time_limit):
+        self._size = size
+        self._cpu_time_limit = cpu_time_limit
+        self._wall_time_limit = wall_time_limit
+        self._started = 0
+        self._workers = queue.LightQueue()
+
+    def _get_worker(self):
+        if self._workers.empty() and self._started < self._size:
+            self._started += 1
+            try:
+                return ScriptsWorker()
+            except Exception:
+                self._started -= 1
+                raise
+        return self._workers.get()
+
+    def process(self, scripts, data):
+        """Execute scripts on data in a worker process.
+
+        :param scripts: List of (checksum, name, data) of the scripts.
+        :param data: Data to rate.
+        :return: Rated data.
+        """
+        worker = self._get_worker()
+        try:
+            return worker.process(scripts,
+                                  data,
+                                  self._cpu_time_limit,
+                                  self._wall_time_limit)
+        finally:
+            if worker.alive:
+                self._workers.put(worker)
+            else:
+                self._started -= 1
+
+    def stop(self):
+        """Stop the idle workers."""
+        while not self._workers.empty():
+            self._workers.get().stop()
+            self._started -= 1
@@ -335,6 +335,35 @@ class BaseStorage(object):
         :type res_type: str
         """
 
+    @abc.abstractmethod
+    def get_time_frame_page(self, begin, end, limit, marker=None, **filters):
+        """Request a page of a time frame from the storage backend.
+
+        :param begin: When to start filtering.
+        :type begin: datetime.datetime
+        :param end: When to stop filtering.
+        :type end: datetime.datetime
+        :param limit: Maximum number of frames in the page.
+        :type limit: int
+        :param marker: (Optional) Marker of the previous page.
+        :type marker: int
+        :param res_type: (Optional) Filter on the resource type.
+        :type res_type: str
+        :param tenant_id: (Optional) Filter on the tenant_id.
+        :type res_type: str
+        :return: The frames and the marker of the next page, None if this
+                 page is the last one.
+        """
+
+    def iter_time_frames(self, begin, end, **filters):
+        """Iterate over a time frame from the storage backend.
+
+        Backends should override it to avoid loading every frame at once.
+        Same parameters as get_time_frame, NoTimeFrame is raised on call
+        when there is no frame.
+        """
+        return iter(self.get_time_frame(begin, end, **filters))
+
     def append(self, raw_data, tenant_id):
         """Append rated data before committing them to the backend.
 
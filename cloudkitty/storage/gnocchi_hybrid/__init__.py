@@ -33,6 +33,8 @@ class GnocchiHybridStorage(sql_storage.SQLAlchemyStorage):
     resources is supported in gnocchi.
     """
     frame_model = models.HybridRatedDataframe
+    state_model = None
+    rollup_model = None
 
     @staticmethod
     def init():
@@ -18,10 +18,13 @@
 try: import simplejson as json
 except ImportError: import json
 import decimal
+import itertools
 from collections import defaultdict
 from sqlalchemy import and_
 
+from oslo_db import exception as db_exc
 from oslo_db.sqlalchemy import utils
+import six
 import sqlalchemy
 
 from cloudkitty import db
@@ -35,15 +38,91 @@ import sqlalchemy.orm.interfaces
 import sqlalchemy.exc
 import datetime
 
+
+def _get_day_start(dt):
+    return datetime.datetime(dt.year, dt.month, dt.day)
+
+
+def _get_next_day(dt):
+    return _get_day_start(dt) + datetime.timedelta(days=1)
+
+
+# Rollup granularities from the coarsest to the finest, with functions
+# returning the start of the bucket of a date and the start of the next one.
+ROLLUPS = (
+    ('month', ck_utils.get_month_start, ck_utils.get_next_month),
+    ('day', _get_day_start, _get_next_day))
+
+
+def split_period(begin, end, rollups=ROLLUPS):
+    """Split a period in chunks covered by the coarsest rollups.
+
+    :param begin: Start of the period.
+    :param end: End of the period.
+    :param rollups: Rollup granularities to use.
+    :return list(tuple): (granularity, begin, end) chunks, granularity is
+                         None for edges only covered by the rated frames.
+    """
+    if begin >= end:
+        return []
+    if not rollups:
+        return [(None, begin, end)]
+    granularity, get_start, get_next = rollups[0]
+    start = get_start(begin)
+    if start != begin:
+        start = get_next(begin)
+    stop = get_start(end)
+    if start >= stop:
+        return split_period(begin, end, rollups[1:])
+    chunks = split_period(begin, start, rollups[1:])
+    chunks.append((granularity, start, stop))
+    chunks.extend(split_period(stop, end, rollups[1:]))
+    return chunks
+
+
+# Tenant of the rollups of frames without tenant, as tenant_id is part of
+# the rollups primary key.
+ROLLUP_NO_TENANT = ''
+
+
+# Keys of the frame description identifying the rated resource, by
+# priority. instance_id comes first as totals are filtered on it.
+RESOURCE_ID_KEYS = ('instance_id', 'resource_id', 'volume_id', 'image_id')
+
+
+def get_resource_id(desc):
+    """Return the identifier of the resource described by a frame.
+
+    :param desc: Resource description, as a dict or a JSON string.
+    """
+    if isinstance(desc, six.string_types):
+        try:
+            desc = json.loads(desc)
+        except ValueError:
+            return
+    if not isinstance(desc, dict):
+        return
+    for key in RESOURCE_ID_KEYS:
+        if desc.get(key):
+            return desc[key]
+
+
 class SQLAlchemyStorage(storage.BaseStorage):
     """SQLAlchemy Storage Backend
 
     """
     frame_model = models.RatedDataFrame
+    # NOTE: Set to None to compute the state from the frames.
+    state_model = models.StorageState
+    rollup_model = models.RatedDataRollup
+    # Number of frames fetched at once when iterating over a time frame
+    stream_batch_size = 1000
 
     def __init__(self, **kwargs):
         super(SQLAlchemyStorage, self).__init__(**kwargs)
         self._session = {}
+        # Frames waiting to be bulk inserted at commit time
+        self._frames = {}
 
     @staticmethod
     def init():
@@ -57,11 +136,20 @@ class SQLAlchemyStorage(storage.BaseStorage):
             self._append_time_frame('_NO_DATA_', empty_frame, tenant_id)
 
     def _commit(self, tenant_id):
-        self._session[tenant_id].commit()
+        session = self._session[tenant_id]
+        frames = self._frames.pop(tenant_id, None)
+        if frames:
+            # NOTE: A single executemany instead of one ORM
+            # flush per frame.
+            session.execute(self.frame_model.__table__.insert(), frames)
+            self._update_rollups(session, frames)
+        self._update_state(session, tenant_id)
+        session.commit()
 
     def _post_commit(self, tenant_id):
         super(SQLAlchemyStorage, self)._post_commit(tenant_id)
         del self._session[tenant_id]
+        self._frames.pop(tenant_id, None)
 
     def _check_session(self, tenant_id):
         session = self._session.get(tenant_id)
@@ -76,8 +164,91 @@ class SQLAlchemyStorage(storage.BaseStorage):
                 self._append_time_frame(service, frame, tenant_id)
                 self._has_data[tenant_id] = True
 
+    def _update_state(self, session, tenant_id):
+        """Move the tenant state forward, in the commit transaction.
+
+        """
+        begin = self.usage_start_dt.get(tenant_id)
+        if self.state_model is None or tenant_id is None or begin is None:
+            return
+        q = utils.model_query(
+            self.state_model,
+            session)
+        q = q.filter(self.state_model.tenant_id == tenant_id)
+        state = q.with_lockmode('update').first()
+        if state is None:
+            session.add(self.state_model(tenant_id=tenant_id, state=begin))
+        elif state.state < begin:
+            state.state = begin
+
+    def _update_rollups(self, session, frames):
+        """Add the rate of new frames to the rollups, in their transaction.
+
+        :param session: Session of the transaction inserting the frames.
+        :param frames: Frames as dicts.
+        """
+        if self.rollup_model is None:
+            return
+        rates = defaultdict(float)
+        for frame in frames:
+            tenant_id = frame.get('tenant_id')
+            if tenant_id is None:
+                tenant_id = ROLLUP_NO_TENANT
+            for granularity, get_start, get_next in ROLLUPS:
+                key = (granularity,
+                       tenant_id,
+                       frame['res_type'],
+                       get_start(frame['begin']))
+                rates[key] += float(frame.get('rate') or 0)
+        next_funcs = dict((rollup[0], rollup[2]) for rollup in ROLLUPS)
+        for key in sorted(rates):
+            granularity, tenant_id, res_type, begin = key
+            q = utils.model_query(
+                self.rollup_model,
+                session)
+            q = q.filter(
+                self.rollup_model.granularity == granularity,
+                self.rollup_model.tenant_id == tenant_id,
+                self.rollup_model.res_type == res_type,
+                self.rollup_model.begin == begin)
+            rate = {'rate': self.rollup_model.rate + rates[key]}
+            if q.update(rate, synchronize_session=False):
+                continue
+            try:
+                with session.begin_nested():
+                    session.add(self.rollup_model(
+                        granularity=granularity,
+                        tenant_id=tenant_id,
+                        res_type=res_type,
+                        begin=begin,
+                        end=next_funcs[granularity](begin),
+                        rate=rates[key]))
+            except db_exc.DBDuplicateEntry:
+                # NOTE: The rollup was created by a concurrent commit
+                q.update(rate, synchronize_session=False)
+
+    def _split_period(self, begin, end):
+        if self.rollup_model is None:
+            return [(None, begin, end)]
+        for dt in (begin, end):
+            # NOTE: Only naive datetimes can be matched with the rollups
+            if not isinstance(dt, datetime.datetime) or dt.tzinfo:
+                return [(None, begin, end)]
+        return split_period(begin, end)
+
     def get_state(self, tenant_id=None):
         session = db.get_session()
+        if self.state_model is not None:
+            if tenant_id:
+                r = session.query(self.state_model).get(tenant_id)
+                state = r.state if r else None
+            else:
+                q = session.query(
+                    sqlalchemy.func.max(self.state_model.state))
+                state = q.scalar()
+            if state:
+                return ck_utils.dt2ts(state)
+            return
         q = utils.model_query(
             self.frame_model,
             session)
@@ -93,15 +264,37 @@ class SQLAlchemyStorage(storage.BaseStorage):
     # Modified by Muralidharan.s for applying a logic for getting 
     # Total value based on Instance
     def get_total(self, begin=None, end=None, tenant_id=None, service=None, instance_id=None):
-        model = models.RatedDataFrame
-
         # Boundary calculation
         if not begin:
             begin = ck_utils.get_month_start()
         if not end:
             end = ck_utils.get_next_month()
 
+        # NOTE: Rollups are not keyed by instance.
+        if instance_id:
+            chunks = [(None, begin, end)]
+        else:
+            chunks = self._split_period(begin, end)
+
         session = db.get_session()
+        total = None
+        for granularity, chunk_begin, chunk_end in chunks:
+            if granularity:
+                q = self._get_rollup_total_query(
+                    session, granularity, chunk_begin, chunk_end,
+                    tenant_id, service)
+            else:
+                q = self._get_total_query(
+                    session, chunk_begin, chunk_end,
+                    tenant_id, service, instance_id)
+            rate = q.scalar()
+            if rate is not None:
+                total = rate if total is None else total + rate
+        return total
+
+    def _get_total_query(self, session, begin, end, tenant_id=None,
+                         service=None, instance_id=None):
+        model = models.RatedDataFrame
         q = session.query(
             sqlalchemy.func.sum(model.rate).label('rate'))
         if tenant_id:
@@ -112,13 +305,27 @@ class SQLAlchemyStorage(storage.BaseStorage):
                 models.RatedDataFrame.res_type == service)
         if instance_id:
             q = q.filter(
-                models.RatedDataFrame.desc.like('%'+instance_id+'%'))
+                models.RatedDataFrame.resource_id == instance_id)
 
         q = q.filter(
             model.begin >= begin,
             model.end <= end)
-        rate = q.scalar()
-        return rate
+        return q
+
+    def _get_rollup_total_query(self, session, granularity, begin, end,
+                                tenant_id=None, service=None):
+        model = self.rollup_model
+        q = session.query(
+            sqlalchemy.func.sum(model.rate).label('rate'))
+        q = q.filter(model.granularity == granularity)
+        if tenant_id:
+            q = q.filter(model.tenant_id == tenant_id)
+        if service:
+            q = q.filter(model.res_type == service)
+        q = q.filter(
+            model.begin >= begin,
+            model.begin < end)
+        return q
 
 
     # For listing invoice
@@ -325,15 +532,36 @@ class SQLAlchemyStorage(storage.BaseStorage):
             end = ck_utils.get_next_month()
 
         session = db.get_session()
-        q = utils.model_query(
-            self.frame_model,
-            session)
-        q = q.filter(
-            self.frame_model.begin >= begin,
-            self.frame_model.end <= end)
-        tenants = q.distinct().values(
-            self.frame_model.tenant_id)
-        return [tenant.tenant_id for tenant in tenants]
+        tenants = set()
+        for granularity, chunk_begin, chunk_end in self._split_period(begin,
+                                                                      end):
+            if granularity:
+                q = utils.model_query(
+                    self.rollup_model,
+                    session)
+                q = q.filter(
+                    self.rollup_model.granularity == granularity,
+                    self.rollup_model.begin >= chunk_begin,
+                    self.rollup_model.begin < chunk_end)
+                q = q.distinct().values(
+                    self.rollup_model.tenant_id)
+            else:
+                q = utils.model_query(
+                    self.frame_model,
+                    session)
+                q = q.filter(
+                    self.frame_model.begin >= chunk_begin,
+                    self.frame_model.end <= chunk_end)
+                q = q.distinct().values(
+                    self.frame_model.tenant_id)
+            for tenant in q:
+                tenant_id = tenant.tenant_id
+                if granularity and tenant_id == ROLLUP_NO_TENANT:
+                    tenant_id = None
+                tenants.add(tenant_id)
+        # Tenants ordered by ID, frames without tenant first
+        return sorted(tenants, key=lambda tenant: (tenant is not None,
+                                                   tenant))
 
     def add_time_frame_custom(self, **kwargs):
         """Create a new time frame custom .
@@ -359,17 +587,19 @@ class SQLAlchemyStorage(storage.BaseStorage):
                                         qty = kwargs.get('qty'),
                                         res_type = kwargs.get('res_type'),
                                         rate = decimal.Decimal(kwargs.get('rate')),
-                                        desc = json.dumps(kwargs.get('desc')))
+                                        desc = json.dumps(kwargs.get('desc')),
+                                        resource_id=get_resource_id(
+                                            kwargs.get('desc')))
 
         try:
             with session.begin():
                 session.add(frame)
+                self._update_rollups(session, [kwargs])
 
         except sqlalchemy.exc.IntegrityError as exc:
                 reason = exc.message
 
-    def get_time_frame(self, begin, end, **filters):
-        session = db.get_session()
+    def _get_time_frame_query(self, session, begin, end, **filters):
         q = utils.model_query(
             self.frame_model,
             session)
@@ -382,11 +612,42 @@ class SQLAlchemyStorage(storage.BaseStorage):
                     getattr(self.frame_model, filter_name) == filter_value)
         if not filters.get('res_type'):
             q = q.filter(self.frame_model.res_type != '_NO_DATA_')
-        count = q.count()
-        if not count:
+        return q
+
+    def get_time_frame(self, begin, end, **filters):
+        return list(self.iter_time_frames(begin, end, **filters))
+
+    def get_time_frame_page(self, begin, end, limit, marker=None, **filters):
+        session = db.get_session()
+        q = self._get_time_frame_query(session, begin, end, **filters)
+        # NOTE: Keyset pagination, ids are growing with the
+        # insertion so a page never has to skip the previous ones.
+        if marker is not None:
+            q = q.filter(self.frame_model.id > marker)
+        q = q.order_by(self.frame_model.id)
+        # Fetch one more frame to know if there is a next page
+        r = q.limit(limit + 1).all()
+        next_marker = None
+        if len(r) > limit:
+            r = r[:limit]
+            next_marker = r[-1].id
+        frames = [entry.to_cloudkitty(self._collector) for entry in r]
+        return frames, next_marker
+
+    def iter_time_frames(self, begin, end, **filters):
+        session = db.get_session()
+        q = self._get_time_frame_query(session, begin, end, **filters)
+        q = q.order_by(self.frame_model.id)
+        # Use a server side cursor where the driver supports it
+        q = q.execution_options(stream_results=True)
+        entries = iter(q.yield_per(self.stream_batch_size))
+        # NOTE: Fetch the first frame now so emptiness is
+        # signaled on call and not when consuming the frames.
+        first_entry = next(entries, None)
+        if first_entry is None:
             raise storage.NoTimeFrame()
-        r = q.all()
-        return [entry.to_cloudkitty(self._collector) for entry in r]
+        return (entry.to_cloudkitty(self._collector)
+                for entry in itertools.chain([first_entry], entries))
 
     def _append_time_frame(self, res_type, frame, tenant_id):
         vol_dict = frame['vol']
@@ -404,10 +665,11 @@ class SQLAlchemyStorage(storage.BaseStorage):
                             qty=qty,
                             res_type=res_type,
                             rate=rate,
-                            desc=desc)
+                            desc=desc,
+                            resource_id=get_resource_id(frame['desc']))
 
     def add_time_frame(self, **kwargs):
-        """Create a new time frame.
+        """Queue a new time frame, bulk inserted on commit.
 
         :param begin: Start of the dataframe.
         :param end: End of the dataframe.
@@ -417,6 +679,9 @@ class SQLAlchemyStorage(storage.BaseStorage):
         :param res_type: Type of the resource.
         :param rate: Calculated rate for this dataframe.
         :param desc: Resource description (metadata).
+        :param resource_id: Identifier of the rated resource.
         """
-        frame = self.frame_model(**kwargs)
-        self._session[kwargs.get('tenant_id')].add(frame)
+        tenant_id = kwargs.get('tenant_id')
+        if tenant_id not in self._frames:
+            self._frames[tenant_id] = []
+        self._frames[tenant_id].append(kwargs)
@@ -0,0 +1,84 @@
+"""create rated_data_rollups table
+
+Revision ID: 4f9efa4601c0
+Revises: d875621d0384
+Create Date: 2016-04-18 10:21:05.319102
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f9efa4601c0'
+down_revision = 'd875621d0384'
+
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+from cloudkitty import utils as ck_utils
+
+
+def upgrade():
+    rollups = op.create_table('rated_data_rollups',
+    sa.Column('granularity', sa.String(length=8), nullable=False),
+    sa.Column('tenant_id', sa.String(length=32), nullable=False),
+    sa.Column('res_type', sa.String(length=255), nullable=False),
+    sa.Column('begin', sa.DateTime(), nullable=False),
+    sa.Column('end', sa.DateTime(), nullable=False),
+    sa.Column('rate', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('granularity', 'tenant_id', 'res_type', 'begin'),
+    mysql_charset='utf8',
+    mysql_engine='InnoDB')
+    op.create_index('ix_rated_data_rollups_granularity_begin',
+                    'rated_data_rollups',
+                    ['granularity', 'begin'],
+                    unique=False)
+
+    # Backfill rollups from the already rated frames, date truncation is
+    # not portable so periods are summed by the database and days and
+    # months here.
+    frames = sa.sql.table('rated_data_frames',
+                          sa.sql.column('tenant_id', sa.String(length=32)),
+                          sa.sql.column('res_type', sa.String(length=255)),
+                          sa.sql.column('begin', sa.DateTime()),
+                          sa.sql.column('rate', sa.Float()))
+    sel = sa.sql.select([
+        frames.c.tenant_id,
+        frames.c.res_type,
+        frames.c.begin,
+        sa.func.sum(frames.c.rate)])
+    sel = sel.group_by(
+        frames.c.tenant_id,
+        frames.c.res_type,
+        frames.c.begin)
+    rates = {}
+    for tenant_id, res_type, begin, rate in op.get_bind().execute(sel):
+        # NOTE: Frames without tenant are rolled up with an empty tenant
+        if tenant_id is None:
+            tenant_id = ''
+        day = datetime.datetime(begin.year, begin.month, begin.day)
+        month = ck_utils.get_month_start(begin)
+        for key in (('day', tenant_id, res_type, day),
+                    ('month', tenant_id, res_type, month)):
+            rates[key] = rates.get(key, 0.0) + float(rate or 0)
+    rows = []
+    for key in sorted(rates):
+        granularity, tenant_id, res_type, begin = key
+        if granularity == 'day':
+            end = begin + datetime.timedelta(days=1)
+        else:
+            end = ck_utils.get_next_month(begin)
+        rows.append({'granularity': granularity,
+                     'tenant_id': tenant_id,
+                     'res_type': res_type,
+                     'begin': begin,
+                     'end': end,
+                     'rate': rates[key]})
+    if rows:
+        op.bulk_insert(rollups, rows)
+
+
+def downgrade():
+    op.drop_index('ix_rated_data_rollups_granularity_begin',
+                  'rated_data_rollups')
+    op.drop_table('rated_data_rollups')
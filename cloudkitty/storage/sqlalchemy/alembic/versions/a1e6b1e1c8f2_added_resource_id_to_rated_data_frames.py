@@ -0,0 +1,77 @@
+"""added resource_id to rated_data_frames
+
+Revision ID: a1e6b1e1c8f2
+Revises: 4f9efa4601c0
+Create Date: 2016-04-20 11:42:18.704528
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a1e6b1e1c8f2'
+down_revision = '4f9efa4601c0'
+
+try: import simplejson as json
+except ImportError: import json
+
+from alembic import op
+import sqlalchemy as sa
+
+# Keys of the frame description identifying the rated resource, by
+# priority. instance_id comes first as totals are filtered on it.
+RESOURCE_ID_KEYS = ('instance_id', 'resource_id', 'volume_id', 'image_id')
+BATCH_SIZE = 1000
+
+
+def get_resource_id(desc):
+    try:
+        desc = json.loads(desc)
+    except (TypeError, ValueError):
+        return
+    if not isinstance(desc, dict):
+        return
+    for key in RESOURCE_ID_KEYS:
+        if desc.get(key):
+            return desc[key]
+
+
+def upgrade():
+    op.add_column('rated_data_frames',
+                  sa.Column('resource_id', sa.String(length=255),
+                            nullable=True))
+    op.create_index('ix_rated_data_frames_resource_id_begin_end',
+                    'rated_data_frames',
+                    ['resource_id', 'begin', 'end'],
+                    unique=False)
+
+    # Backfill resource_id from the frames description
+    frames = sa.sql.table('rated_data_frames',
+                          sa.sql.column('id', sa.Integer()),
+                          sa.sql.column('desc', sa.Text()),
+                          sa.sql.column('resource_id', sa.String(length=255)))
+    update = frames.update().where(
+        frames.c.id == sa.sql.bindparam('frame_id')).values(
+        resource_id=sa.sql.bindparam('frame_resource_id'))
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        sel = sa.sql.select([frames.c.id, frames.c.desc])
+        sel = sel.where(frames.c.id > last_id)
+        sel = sel.order_by(frames.c.id).limit(BATCH_SIZE)
+        rows = conn.execute(sel).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        values = []
+        for frame_id, desc in rows:
+            resource_id = get_resource_id(desc)
+            if resource_id:
+                values.append({'frame_id': frame_id,
+                               'frame_resource_id': resource_id})
+        if values:
+            conn.execute(update, values)
+
+
+def downgrade():
+    op.drop_index('ix_rated_data_frames_resource_id_begin_end',
+                  'rated_data_frames')
+    op.drop_column('rated_data_frames', 'resource_id')
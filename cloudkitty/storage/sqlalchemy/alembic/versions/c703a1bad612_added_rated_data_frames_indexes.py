@@ -0,0 +1,34 @@
+"""Added rated_data_frames indexes.
+
+Revision ID: c703a1bad612
+Revises: 3eecce93ff43
+Create Date: 2016-04-12 10:21:43.118254
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c703a1bad612'
+down_revision = '3eecce93ff43'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_rated_data_frames_tenant_id_begin_end',
+                    'rated_data_frames',
+                    ['tenant_id', 'begin', 'end'])
+    op.create_index('ix_rated_data_frames_res_type_begin_end',
+                    'rated_data_frames',
+                    ['res_type', 'begin', 'end'])
+    op.create_index('ix_rated_data_frames_begin_end',
+                    'rated_data_frames',
+                    ['begin', 'end'])
+
+
+def downgrade():
+    op.drop_index('ix_rated_data_frames_begin_end',
+                  'rated_data_frames')
+    op.drop_index('ix_rated_data_frames_res_type_begin_end',
+                  'rated_data_frames')
+    op.drop_index('ix_rated_data_frames_tenant_id_begin_end',
+                  'rated_data_frames')
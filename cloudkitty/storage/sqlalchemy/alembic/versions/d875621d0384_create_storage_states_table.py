@@ -0,0 +1,38 @@
+"""create storage_states table
+
+Revision ID: d875621d0384
+Revises: c703a1bad612
+Create Date: 2016-04-14 15:02:37.553910
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd875621d0384'
+down_revision = 'c703a1bad612'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    states = op.create_table('storage_states',
+    sa.Column('tenant_id', sa.String(length=32), nullable=False),
+    sa.Column('state', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('tenant_id'),
+    mysql_charset='utf8',
+    mysql_engine='InnoDB')
+
+    # Backfill states from the already rated frames
+    frames = sa.sql.table('rated_data_frames',
+                          sa.sql.column('tenant_id', sa.String(length=32)),
+                          sa.sql.column('begin', sa.DateTime()))
+    sel = sa.sql.select([
+        frames.c.tenant_id,
+        sa.func.max(frames.c.begin)])
+    sel = sel.where(frames.c.tenant_id != None)  # noqa
+    sel = sel.group_by(frames.c.tenant_id)
+    op.execute(states.insert().from_select(['tenant_id', 'state'], sel))
+
+
+def downgrade():
+    op.drop_table('storage_states')
@@ -30,8 +30,17 @@ class RatedDataFrame(Base, models.ModelBase):
     """A rated data frame.
 
     """
-    __table_args__ = {'mysql_charset': "utf8",
-                      'mysql_engine': "InnoDB"}
+    __table_args__ = (
+        sqlalchemy.Index('ix_rated_data_frames_tenant_id_begin_end',
+                         'tenant_id', 'begin', 'end'),
+        sqlalchemy.Index('ix_rated_data_frames_res_type_begin_end',
+                         'res_type', 'begin', 'end'),
+        sqlalchemy.Index('ix_rated_data_frames_begin_end',
+                         'begin', 'end'),
+        sqlalchemy.Index('ix_rated_data_frames_resource_id_begin_end',
+                         'resource_id', 'begin', 'end'),
+        {'mysql_charset': "utf8",
+         'mysql_engine': "InnoDB"})
     __tablename__ = 'rated_data_frames'
 
     id = sqlalchemy.Column(sqlalchemy.Integer,
@@ -52,6 +61,8 @@ class RatedDataFrame(Base, models.ModelBase):
                              nullable=False)
     desc = sqlalchemy.Column(sqlalchemy.Text(),
                              nullable=False)
+    resource_id = sqlalchemy.Column(sqlalchemy.String(255),
+                                    nullable=True)
 
     def to_cloudkitty(self, collector=None):
         # Rating informations
@@ -85,6 +96,46 @@ class RatedDataFrame(Base, models.ModelBase):
         ck_dict['usage'] = usage_dict
         return ck_dict
 
+
+class StorageState(Base, models.ModelBase):
+    """Last committed frame of a tenant.
+
+    """
+    __table_args__ = {'mysql_charset': "utf8",
+                      'mysql_engine': "InnoDB"}
+    __tablename__ = 'storage_states'
+
+    tenant_id = sqlalchemy.Column(sqlalchemy.String(32),
+                                  primary_key=True)
+    state = sqlalchemy.Column(sqlalchemy.DateTime,
+                              nullable=False)
+
+
+class RatedDataRollup(Base, models.ModelBase):
+    """Rates of a tenant's resource type summed over a day or a month.
+
+    """
+    __table_args__ = (
+        sqlalchemy.Index('ix_rated_data_rollups_granularity_begin',
+                         'granularity', 'begin'),
+        {'mysql_charset': "utf8",
+         'mysql_engine': "InnoDB"})
+    __tablename__ = 'rated_data_rollups'
+
+    granularity = sqlalchemy.Column(sqlalchemy.String(8),
+                                    primary_key=True)
+    tenant_id = sqlalchemy.Column(sqlalchemy.String(32),
+                                  primary_key=True)
+    res_type = sqlalchemy.Column(sqlalchemy.String(255),
+                                 primary_key=True)
+    begin = sqlalchemy.Column(sqlalchemy.DateTime,
+                              primary_key=True)
+    end = sqlalchemy.Column(sqlalchemy.DateTime,
+                            nullable=False)
+    rate = sqlalchemy.Column(sqlalchemy.Float(),
+                             nullable=False)
+
+
 class InvoiceDetails(Base, models.ModelBase):
     """Invoice details table.
     """
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+#
+import os
+import shutil
+import tempfile
+
+import mock
+from oslo_utils import timeutils
+
+from cloudkitty.collector import ceilometer
+from cloudkitty import tests
+from cloudkitty.transformer import ceilometer as ceilometer_transformer
+from cloudkitty.transformer import format as format_transformer
+
+
+class CeilometerCollectorTest(tests.TestCase):
+    def setUp(self):
+        super(CeilometerCollectorTest, self).setUp()
+        patcher = mock.patch('ceilometerclient.client.get_client')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        transformers = {
+            'CeilometerTransformer':
+                ceilometer_transformer.CeilometerTransformer(),
+            'CloudKittyFormatTransformer':
+                format_transformer.CloudKittyFormatTransformer()}
+        self.collector = ceilometer.CeilometerCollector(transformers,
+                                                        period=3600)
+        self.conn = self.collector._conn
+        self.conn.resources.get.side_effect = (
+            lambda resource_id: mock.Mock(metadata={'name': resource_id}))
+
+    def test_fetch_only_missing_resources(self):
+        self.collector._cacher.add_resource_detail('image',
+                                                   'image1',
+                                                   {'name': 'cached'})
+        details = self.collector.get_resources_detail(
+            'image',
+            ['image1', 'image2', 'image3', 'image2'])
+        self.assertEqual(2, self.conn.resources.get.call_count)
+        self.assertEqual({'image1': {'name': 'cached'},
+                          'image2': {'name': 'image2'},
+                          'image3': {'name': 'image3'}},
+                         details)
+        self.assertEqual(
+            {'name': 'image3'},
+            self.collector._cacher.get_resource_detail('image', 'image3'))
+
+    def test_shared_stats_queried_once_for_every_tenant(self):
+        self.conf.set_override('shared_stats',
+                               True,
+                               'ceilometer_collector')
+        stats = [
+            mock.Mock(groupby={'project_id': 'tenant1',
+                               'resource_id': 'instance1'}),
+            mock.Mock(groupby={'project_id': 'tenant2',
+                               'resource_id': 'instance2'}),
+            mock.Mock(groupby={'project_id': 'tenant1',
+                               'resource_id': 'instance3'})]
+        self.conn.statistics.list.return_value = stats
+        self.collector.prefetch(3600, 7200, ['compute', 'instance.addon'])
+        self.assertEqual(['instance1', 'instance3'],
+                         self.collector.active_resources('instance',
+                                                         3600,
+                                                         7200,
+                                                         'tenant1'))
+        self.assertEqual(['instance2'],
+                         self.collector.active_resources('instance',
+                                                         3600,
+                                                         7200,
+                                                         'tenant2'))
+        self.assertEqual([], self.collector.active_resources('instance',
+                                                             3600,
+                                                             7200,
+                                                             'tenant3'))
+        self.conn.statistics.list.assert_called_once_with(
+            meter_name='instance',
+            period=0,
+            q=mock.ANY,
+            groupby=['project_id', 'resource_id'])
+
+
+class CeilometerResourceCacherTest(tests.TestCase):
+    @mock.patch.object(timeutils, 'utcnow_ts')
+    def test_bounded_cache_with_ttls(self, patch_utcnow_ts_mock):
+        patch_utcnow_ts_mock.return_value = 100
+        cacher = ceilometer.CeilometerResourceCacher(
+            size=2,
+            ttl=60,
+            ttls={'compute': 10})
+        cacher.add_resource_detail('compute', 'instance1', {'flavor': 'm1'})
+        cacher.add_resource_detail('image', 'image1', {'name': 'cirros'})
+        cacher.add_resource_detail('image', 'image2', {'name': 'fedora'})
+        self.assertFalse(cacher.has_resource_detail('compute', 'instance1'))
+        self.assertEqual(1, cacher.evictions)
+        cacher.add_resource_detail('compute', 'instance1', {'flavor': 'm1'})
+        patch_utcnow_ts_mock.return_value = 120
+        self.assertRaises(ceilometer.ResourceNotFound,
+                          cacher.get_resource_detail,
+                          'compute',
+                          'instance1')
+        self.assertEqual({'name': 'fedora'},
+                         cacher.get_resource_detail('image', 'image2'))
+        self.assertEqual(1, cacher.hits)
+        self.assertEqual(1, cacher.misses)
+
+    def test_shared_sqlite_backend(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'resources.sqlite')
+        cacher = ceilometer.CeilometerResourceCacher(
+            backend=ceilometer.SQLiteResourceBackend(path))
+        cacher.add_resource_detail('image', 'image1', {'name': 'cirros'})
+        other_cacher = ceilometer.CeilometerResourceCacher(
+            backend=ceilometer.SQLiteResourceBackend(path))
+        self.assertEqual({'name': 'cirros'},
+                         other_cacher.get_resource_detail('image', 'image1'))
+        self.assertFalse(other_cacher.has_resource_detail('image', 'image2'))
+
+    @mock.patch.object(timeutils, 'utcnow_ts')
+    def test_shared_sqlite_backend_keeps_expiration(self,
+                                                    patch_utcnow_ts_mock):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'resources.sqlite')
+        patch_utcnow_ts_mock.return_value = 100
+        cacher = ceilometer.CeilometerResourceCacher(
+            ttl=60,
+            backend=ceilometer.SQLiteResourceBackend(path))
+        cacher.add_resource_detail('image', 'image1', {'name': 'cirros'})
+        patch_utcnow_ts_mock.return_value = 150
+        other_cacher = ceilometer.CeilometerResourceCacher(
+            ttl=60,
+            backend=ceilometer.SQLiteResourceBackend(path))
+        self.assertEqual({'name': 'cirros'},
+                         other_cacher.get_resource_detail('image', 'image1'))
+        patch_utcnow_ts_mock.return_value = 165
+        self.assertFalse(other_cacher.has_resource_detail('image', 'image1'))
@@ -14,9 +14,13 @@
 #    under the License.
 #
 #
+import mock
+
 from cloudkitty.collector import gnocchi
 from cloudkitty import tests
 from cloudkitty.tests import samples
+from cloudkitty.transformer import format as format_transformer
+from cloudkitty.transformer import gnocchi as gnocchi_transformer
 
 
 class GnocchiCollectorTest(tests.TestCase):
@@ -128,3 +132,122 @@ class GnocchiCollectorTest(tests.TestCase):
             lop='or')
         expected = {'or': ['dummy1', 'dummy2']}
         self.assertEqual(expected, actual)
+
+    def _get_collector(self):
+        transformers = {
+            'GnocchiTransformer': gnocchi_transformer.GnocchiTransformer(),
+            'CloudKittyFormatTransformer':
+                format_transformer.CloudKittyFormatTransformer()}
+        with mock.patch('gnocchiclient.client.Client'):
+            return gnocchi.GnocchiCollector(transformers, period=3600)
+
+    def test_expand_metrics_in_one_call_per_metric(self):
+        collector = self._get_collector()
+        conn = collector._conn
+        conn.metric.aggregation.side_effect = [
+            [{'group': {'id': 'volume1'},
+              'measures': [('2016-01-01T00:00:00', 3600.0, 10.0)]},
+             {'group': {'id': 'volume2'},
+              'measures': [('2016-01-01T00:00:00', 3600.0, 20.0)]}]]
+        resources = [{'resource_id': 'volume1'},
+                     {'resource_id': 'volume2'},
+                     {'resource_id': 'volume3'}]
+        collector._expand_metrics(resources,
+                                  collector.metrics_mappings['volume'],
+                                  0,
+                                  3600)
+        self.assertEqual(1, conn.metric.aggregation.call_count)
+        self.assertEqual([10.0, 20.0, None],
+                         [resource['volume.size'] for resource in resources])
+
+    def _volume(self, resource_id, name, revision=1):
+        return {'id': resource_id,
+                'revision': revision,
+                'project_id': self._tenant_id,
+                'user_id': None,
+                'display_name': name,
+                'metrics': {}}
+
+    def test_resources_revisions_in_one_search(self):
+        collector = self._get_collector()
+        conn = collector._conn
+        conn.resource.search.side_effect = [
+            [self._volume('volume1', 'renamed', 2),
+             self._volume('volume2', 'volume2'),
+             self._volume('volume1', 'volume1')]]
+        resources = collector._search_resources('volume',
+                                                0,
+                                                3600,
+                                                project_id=self._tenant_id)
+        self.assertEqual(1, conn.resource.search.call_count)
+        self.assertTrue(conn.resource.search.call_args[1]['history'])
+        self.assertEqual(['renamed', 'volume2'],
+                         [resource['name'] for resource in resources])
+
+    def test_generic_retrieve_filters_on_project(self):
+        collector = self._get_collector()
+        with mock.patch.object(collector, 'resource_info',
+                               return_value=[]) as resource_info:
+            self.assertRaises(gnocchi.collector.NoDataCollected,
+                              collector.generic_retrieve,
+                              'volume',
+                              0,
+                              3600,
+                              self._tenant_id)
+        resource_info.assert_called_once_with('volume',
+                                              0,
+                                              3600,
+                                              project_id=self._tenant_id,
+                                              q_filter=None)
+
+    def test_resources_revisions_paginated(self):
+        collector = self._get_collector()
+        collector.search_page_size = 2
+        conn = collector._conn
+        conn.resource.search.side_effect = [
+            [self._volume('volume1', 'renamed', 2),
+             self._volume('volume2', 'volume2')],
+            [self._volume('volume1', 'volume1')]]
+        resources = collector._search_resources('volume',
+                                                0,
+                                                3600,
+                                                project_id=self._tenant_id)
+        self.assertEqual(
+            [None, 'volume2@1'],
+            [call[1]['marker']
+             for call in conn.resource.search.call_args_list])
+        self.assertEqual(['renamed', 'volume2'],
+                         [resource['name'] for resource in resources])
+
+    def test_resources_paginated_without_history(self):
+        collector = self._get_collector()
+        collector.search_page_size = 1
+        conn = collector._conn
+        conn.resource.search.side_effect = [
+            [self._volume('volume1', 'volume1')],
+            []]
+        resources = collector._search_resources('volume',
+                                                0,
+                                                project_id=self._tenant_id)
+        self.assertEqual(
+            [None, 'volume1'],
+            [call[1]['marker']
+             for call in conn.resource.search.call_args_list])
+        self.assertEqual(['volume1'],
+                         [resource['name'] for resource in resources])
+
+    def test_history_marker_without_revision(self):
+        collector = self._get_collector()
+        collector.search_page_size = 1
+        conn = collector._conn
+        volume = self._volume('volume1', 'volume1')
+        del volume['revision']
+        conn.resource.search.side_effect = [[volume], []]
+        collector._search_resources('volume',
+                                    0,
+                                    3600,
+                                    project_id=self._tenant_id)
+        self.assertEqual(
+            [None, 'volume1'],
+            [call[1]['marker']
+             for call in conn.resource.search.call_args_list])
@@ -38,6 +38,7 @@ from cloudkitty.common import rpc
 from cloudkitty import db
 from cloudkitty.db import api as ck_db_api
 from cloudkitty import rating
+from cloudkitty.rating import processors as rating_processors
 from cloudkitty import storage
 from cloudkitty.storage.sqlalchemy import models
 from cloudkitty import tests
@@ -240,6 +241,40 @@ class QuoteFakeRPC(BaseFakeRPC):
     endpoint = FakeRPCEndpoint
 
 
+class LocalQuoteFixture(fixture.GabbiFixture):
+    class FakeQuoteModule(tests.FakeRatingModule):
+        def process(self, data):
+            for cur_data in data:
+                for entries in cur_data['usage'].values():
+                    for entry in entries:
+                        entry['rating'] = {'price': decimal.Decimal('2.0')}
+            return data
+
+    stevedore_mgr = extension.ExtensionManager
+
+    def start_fixture(self):
+        cfg.CONF.set_override('local_quote', True, 'api', enforce_type=True)
+        rating_processors.processors_cache.clear()
+        fake_module = self.FakeQuoteModule()
+        fake_module.module_name = 'fake1'
+        fake_mgr = self.stevedore_mgr.make_test_instance(
+            [extension.Extension(
+                'fake1',
+                'cloudkitty.tests.FakeRatingModule1',
+                None,
+                fake_module)],
+            'cloudkitty.rating.processors')
+        self.mock = mock.patch(
+            'cloudkitty.extension_manager.EnabledExtensionManager',
+            return_value=fake_mgr)
+        self.mock.start()
+
+    def stop_fixture(self):
+        self.mock.stop()
+        rating_processors.processors_cache.clear()
+        cfg.CONF.clear_override('local_quote', 'api')
+
+
 class BaseStorageDataFixture(fixture.GabbiFixture):
     def create_fake_data(self, begin, end):
         data = [{
@@ -176,6 +176,22 @@ class StorageTest(tests.TestCase):
         self.storage.commit(self._tenant_id)
         self.assertNotIn(self._tenant_id, self.storage._session)
 
+    def test_frames_inserted_on_commit(self):
+        working_data = copy.deepcopy(samples.RATED_DATA)
+        self.storage.append([working_data[0]], self._tenant_id)
+        self.assertIn(self._tenant_id, self.storage._frames)
+        self.assertRaises(
+            storage.NoTimeFrame,
+            self.storage.get_time_frame,
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.FIRST_PERIOD_END)
+        self.storage.commit(self._tenant_id)
+        self.assertNotIn(self._tenant_id, self.storage._frames)
+        stored_data = self.storage.get_time_frame(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.FIRST_PERIOD_END)
+        self.assertEqual(2, len(stored_data))
+
     def test_update_period_on_append(self):
         self.assertNotIn(self._tenant_id, self.storage.usage_start)
         self.assertNotIn(self._tenant_id, self.storage.usage_start_dt)
@@ -273,6 +289,23 @@ class StorageTest(tests.TestCase):
             end=samples.SECOND_PERIOD_END)
         self.assertEqual(3, len(data))
 
+    def test_iter_no_frame_raises_on_call(self):
+        self.insert_different_data_two_tenants()
+        self.assertRaises(
+            storage.NoTimeFrame,
+            self.storage.iter_time_frames,
+            begin=samples.FIRST_PERIOD_BEGIN - 3600,
+            end=samples.FIRST_PERIOD_BEGIN)
+
+    def test_iter_frames_on_two_periods(self):
+        self.insert_data()
+        frames = self.storage.iter_time_frames(
+            begin=samples.FIRST_PERIOD_BEGIN,
+            end=samples.SECOND_PERIOD_END,
+            tenant_id=self._tenant_id)
+        self.assertNotIsInstance(frames, list)
+        self.assertEqual(3, len(list(frames)))
+
     # State
     def test_get_state_when_nothing_in_storage(self):
         state = self.storage.get_state()
@@ -299,6 +332,20 @@ class StorageTest(tests.TestCase):
         state = self.storage.get_state(self._tenant_id)
         self.assertEqual(samples.FIRST_PERIOD_BEGIN, state)
 
+    def test_get_state_does_not_go_backward(self):
+        self.storage.nodata(
+            samples.SECOND_PERIOD_BEGIN,
+            samples.SECOND_PERIOD_END,
+            self._tenant_id)
+        self.storage.commit(self._tenant_id)
+        self.storage.nodata(
+            samples.FIRST_PERIOD_BEGIN,
+            samples.FIRST_PERIOD_END,
+            self._tenant_id)
+        self.storage.commit(self._tenant_id)
+        state = self.storage.get_state(self._tenant_id)
+        self.assertEqual(samples.SECOND_PERIOD_BEGIN, state)
+
     # Total
     def test_get_empty_total(self):
         self.insert_data()
@@ -338,6 +385,32 @@ class StorageTest(tests.TestCase):
             service='compute')
         self.assertEqual(0.84, total)
 
+    def test_get_total_filtering_on_instance(self):
+        self.insert_data()
+        instance_id = samples.COMPUTE_METADATA['instance_id']
+        total = self.storage.get_total(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN),
+            end=ck_utils.ts2dt(samples.FIRST_PERIOD_END),
+            instance_id=instance_id)
+        self.assertEqual(0.84, total)
+        total = self.storage.get_total(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN),
+            end=ck_utils.ts2dt(samples.FIRST_PERIOD_END),
+            instance_id=instance_id[:8])
+        self.assertIsNone(total)
+
+    def test_get_total_filtering_on_instance_with_resource_id(self):
+        working_data = copy.deepcopy(samples.RATED_DATA)
+        compute = working_data[0]['usage']['compute'][0]
+        compute['desc']['resource_id'] = 'd2d2a3e4-0b85-4e43-a7b4-1f1a1e9d2b9c'
+        self.storage.append(working_data, self._tenant_id)
+        self.storage.commit(self._tenant_id)
+        total = self.storage.get_total(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN),
+            end=ck_utils.ts2dt(samples.FIRST_PERIOD_END),
+            instance_id=samples.COMPUTE_METADATA['instance_id'])
+        self.assertEqual(0.42, total)
+
     @mock.patch.object(ck_utils, 'utcnow',
                        return_value=ck_utils.ts2dt(samples.INITIAL_TIMESTAMP))
     def test_get_total_no_filter(self, patch_utcnow_mock):
@@ -346,6 +419,33 @@ class StorageTest(tests.TestCase):
         self.assertEqual(1.9473999999999998, total)
         self.assertEqual(2, patch_utcnow_mock.call_count)
 
+    def test_get_total_from_rollups_and_edges(self):
+        self.insert_data()
+        total = self.storage.get_total(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN - 3600),
+            end=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN + 86400))
+        self.assertAlmostEqual(1.9474, total)
+        total = self.storage.get_total(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN - 3600),
+            end=ck_utils.get_next_month(
+                ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN)),
+            tenant_id=self._tenant_id,
+            service='compute')
+        self.assertAlmostEqual(0.84, total)
+
+    def test_get_total_of_frames_without_tenant_from_rollups(self):
+        working_data = copy.deepcopy(samples.RATED_DATA)
+        self.storage.append(working_data, None)
+        self.storage.commit(None)
+        total = self.storage.get_total(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN - 3600),
+            end=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN + 86400))
+        self.assertAlmostEqual(0.9737, total)
+        tenants = self.storage.get_tenants(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN),
+            end=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN + 86400))
+        self.assertEqual([None], tenants)
+
     # Tenants
     def test_get_empty_tenant_with_nothing_in_storage(self):
         tenants = self.storage.get_tenants(
@@ -366,7 +466,7 @@ class StorageTest(tests.TestCase):
             begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN),
             end=ck_utils.ts2dt(samples.SECOND_PERIOD_END))
         self.assertListEqual(
-            [self._tenant_id, self._other_tenant_id],
+            sorted([self._tenant_id, self._other_tenant_id]),
             tenants)
         tenants = self.storage.get_tenants(
             begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN),
@@ -381,6 +481,15 @@ class StorageTest(tests.TestCase):
             [self._other_tenant_id],
             tenants)
 
+    def test_get_tenants_from_rollups(self):
+        self.insert_different_data_two_tenants()
+        tenants = self.storage.get_tenants(
+            begin=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN),
+            end=ck_utils.ts2dt(samples.FIRST_PERIOD_BEGIN + 86400))
+        self.assertEqual(
+            sorted([self._tenant_id, self._other_tenant_id]),
+            tenants)
+
     def add_invoice(self):
 
         self.storage.add_invoice(invoice_id=samples.INVOICE_DICT_DEMO['invoice_id'],
@@ -514,6 +514,40 @@ class HashMapRatingTest(tests.TestCase):
         self.assertEqual(expect,
                          self._hash._entries)
 
+    def test_bulk_load_rates(self):
+        self._generate_hashmap_rules()
+        rates = self._db_api.load_rates()
+        self.assertEqual(['compute'], rates['services'])
+        self.assertEqual([('compute', 'flavor'), ('compute', 'memory')],
+                         sorted(rates['fields']))
+        self.assertIn({'service': 'compute',
+                       'field': None,
+                       'group': None,
+                       'value': None,
+                       'type': 'rate',
+                       'cost': decimal.Decimal('1.42')},
+                      rates['mappings'])
+        self.assertIn({'service': 'compute',
+                       'field': 'flavor',
+                       'group': 'test_group',
+                       'value': 'm1.large',
+                       'type': 'rate',
+                       'cost': decimal.Decimal('13.37')},
+                      rates['mappings'])
+        self.assertEqual(3, len(rates['mappings']))
+        self.assertEqual(2, len(rates['thresholds']))
+
+    def test_compile_mappings(self):
+        self._generate_hashmap_rules()
+        self._hash.reload_config()
+        expect = {
+            ('compute', 'flavor', 'm1.tiny'): [
+                ('_DEFAULT_', 'flat', decimal.Decimal('1.337'))],
+            ('compute', 'flavor', 'm1.large'): [
+                ('test_group', 'rate', decimal.Decimal('13.37'))]}
+        self.assertEqual(expect,
+                         self._hash._field_mappings)
+
     def test_load_mappings(self):
         mapping_list = []
         service_db = self._db_api.create_service('compute')
@@ -745,6 +779,28 @@ class HashMapRatingTest(tests.TestCase):
         compute_list[2]['rating'] = {'price': decimal.Decimal('0.1')}
         self.assertEqual(expected_data, actual_data)
 
+    def test_process_thresholds_picks_highest_level(self):
+        threshold_groups = {
+            'test_group': {
+                decimal.Decimal(level): {
+                    'cost': decimal.Decimal(level),
+                    'type': 'flat'}
+                for level in range(0, 1000, 10)}}
+        sorted_groups = self._hash._sort_thresholds(threshold_groups)
+        self._hash.process_thresholds(sorted_groups,
+                                      decimal.Decimal('425'),
+                                      'field')
+        self.assertEqual({'level': decimal.Decimal('420'),
+                          'cost': decimal.Decimal('420'),
+                          'type': 'flat',
+                          'scope': 'field'},
+                         self._hash._res['test_group']['threshold'])
+        self._hash._res = {}
+        self._hash.process_thresholds(sorted_groups,
+                                      decimal.Decimal('-1'),
+                                      'field')
+        self.assertEqual({}, self._hash._res)
+
     def test_update_result_flat(self):
         self._hash.update_result(
             'test_group',
@@ -877,3 +933,46 @@ class HashMapRatingTest(tests.TestCase):
         compute_list[2]['rating'] = {'price': decimal.Decimal('2.6357')}
         self._hash.process(actual_data)
         self.assertEqual(expected_data, actual_data)
+
+    def test_process_rating_batch_is_exact(self):
+        service_db = self._db_api.create_service('compute')
+        flavor_db = self._db_api.create_field(service_db.service_id,
+                                              'flavor')
+        group_db = self._db_api.create_group('test_group')
+        self._db_api.create_mapping(
+            cost='1.00',
+            map_type='flat',
+            service_id=service_db.service_id)
+        self._db_api.create_mapping(
+            value='m1.nano',
+            cost='1.337',
+            map_type='flat',
+            field_id=flavor_db.field_id,
+            group_id=group_db.group_id)
+        memory_db = self._db_api.create_field(service_db.service_id,
+                                              'memory')
+        self._db_api.create_threshold(
+            level=128,
+            cost='0.2',
+            map_type='flat',
+            field_id=memory_db.field_id,
+            group_id=group_db.group_id)
+        self._db_api.create_threshold(
+            level=2,
+            cost='0.9',
+            map_type='rate',
+            service_id=service_db.service_id)
+        self._hash.reload_config()
+        data = copy.deepcopy(CK_RESOURCES_DATA)
+        compute_list = data[0]['usage']['compute']
+        compute_list.extend(copy.deepcopy(compute_list))
+        for index, item in enumerate(compute_list):
+            item['vol']['qty'] = [1, 2, 3, decimal.Decimal('2.0')][index % 4]
+        expected_data = self._hash.process(copy.deepcopy(data))
+        self.conf.set_override('batch_processing', True, 'hashmap')
+        actual_data = self._hash.process(copy.deepcopy(data))
+        self.assertEqual(
+            [str(item['rating']['price'])
+             for item in expected_data[0]['usage']['compute']],
+            [str(item['rating']['price'])
+             for item in actual_data[0]['usage']['compute']])
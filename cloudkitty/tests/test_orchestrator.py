@@ -15,12 +15,17 @@
 #
 # @author: Stéphane Albert
 #
+import decimal
+
+import eventlet
 import mock
 from oslo_messaging import conffixture
 from stevedore import extension
 
 from cloudkitty import orchestrator
+from cloudkitty.rating import processors as rating_processors
 from cloudkitty import tests
+from cloudkitty import utils as ck_utils
 
 
 class FakeKeystoneClient(object):
@@ -42,6 +47,7 @@ class OrchestratorTest(tests.TestCase):
                                enforce_type=True)
         self.conf.import_group('keystone_fetcher',
                                'cloudkitty.tenant_fetcher.keystone')
+        rating_processors.processors_cache.clear()
 
     def setup_fake_modules(self):
         fake_module1 = tests.FakeRatingModule()
@@ -79,7 +85,7 @@ class OrchestratorTest(tests.TestCase):
                 fake_extensions,
                 'cloudkitty.rating.processors')
             stevemock.return_value = fake_mgr
-            worker = orchestrator.BaseWorker()
+            worker = rating_processors.BaseWorker()
             stevemock.assert_called_once_with(
                 'cloudkitty.rating.processors',
                 invoke_kwds={'tenant_id': None})
@@ -89,3 +95,243 @@ class OrchestratorTest(tests.TestCase):
             self.assertEqual(2, worker._processors[1].obj.priority)
             self.assertEqual('fake2', worker._processors[2].name)
             self.assertEqual(1, worker._processors[2].obj.priority)
+
+    def test_processors_shared_between_workers(self):
+        fake_extensions = self.setup_fake_modules()
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        with mock.patch(ck_ext_mgr) as stevemock:
+            fake_mgr = extension.ExtensionManager.make_test_instance(
+                fake_extensions,
+                'cloudkitty.rating.processors')
+            stevemock.return_value = fake_mgr
+            worker1 = rating_processors.BaseWorker()
+            worker2 = rating_processors.BaseWorker(
+                'f266f30b11f246b589fd266f85eeec39')
+            self.assertEqual(1, stevemock.call_count)
+            self.assertEqual(
+                [proc.obj for proc in worker1._processors],
+                [proc.obj for proc in worker2._processors])
+
+    def test_processors_reloaded_on_rules_version_change(self):
+        fake_extensions = self.setup_fake_modules()
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        with mock.patch(ck_ext_mgr) as stevemock:
+            fake_mgr = extension.ExtensionManager.make_test_instance(
+                fake_extensions,
+                'cloudkitty.rating.processors')
+            stevemock.return_value = fake_mgr
+            rating_processors.BaseWorker()
+            self.conn.get_module_info().bump_version('fake1')
+            rating_processors.BaseWorker()
+            self.assertEqual(2, stevemock.call_count)
+
+    def test_processors_reloaded_on_reload_module(self):
+        fake_extensions = self.setup_fake_modules()
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        endpoint = orchestrator.RatingEndpoint(None)
+        with mock.patch(ck_ext_mgr) as stevemock:
+            fake_mgr = extension.ExtensionManager.make_test_instance(
+                fake_extensions,
+                'cloudkitty.rating.processors')
+            stevemock.return_value = fake_mgr
+            rating_processors.BaseWorker()
+            endpoint.reload_module({}, 'fake1')
+            rating_processors.BaseWorker()
+            self.assertEqual(2, stevemock.call_count)
+
+    def test_processors_not_cached_when_cleared_while_loading(self):
+        fake_extensions = self.setup_fake_modules()
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        endpoint = orchestrator.RatingEndpoint(None)
+        fake_mgr = extension.ExtensionManager.make_test_instance(
+            fake_extensions,
+            'cloudkitty.rating.processors')
+
+        def load_manager(*args, **kwargs):
+            eventlet.spawn(endpoint.reload_module, {}, 'fake1')
+            eventlet.sleep(0)
+            return fake_mgr
+
+        with mock.patch(ck_ext_mgr) as stevemock:
+            stevemock.side_effect = load_manager
+            rating_processors.BaseWorker()
+            eventlet.sleep(0)
+            rating_processors.BaseWorker()
+            self.assertEqual(2, stevemock.call_count)
+
+    def test_quote_cached(self):
+        endpoint = orchestrator.RatingEndpoint(None)
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        res_data = [{'usage': {'compute': [{
+            'desc': {'flavor': 'm1.nano', 'image_id': 'cirros'},
+            'vol': {'qty': 1, 'unit': 'instance'}}]}}]
+        fake_mgr = extension.ExtensionManager.make_test_instance(
+            [],
+            'cloudkitty.rating.processors')
+        with mock.patch(ck_ext_mgr, return_value=fake_mgr), \
+                mock.patch.object(rating_processors.APIWorker, 'quote',
+                                  return_value=decimal.Decimal('0.42')) as m:
+            self.assertEqual('0.42', endpoint.quote({}, res_data))
+            self.assertEqual('0.42', endpoint.quote({}, res_data))
+            self.assertEqual(1, m.call_count)
+            endpoint.reload_modules({})
+            self.assertEqual('0.42', endpoint.quote({}, res_data))
+            self.assertEqual(2, m.call_count)
+            self.conn.get_module_info().bump_version('hashmap')
+            self.assertEqual('0.42', endpoint.quote({}, res_data))
+            self.assertEqual(3, m.call_count)
+
+    def test_process_tenant_releases_lock_on_worker_error(self):
+        with mock.patch.object(orchestrator.Orchestrator, '__init__',
+                               return_value=None):
+            orch = orchestrator.Orchestrator()
+        orch.collector = None
+        orch.storage = None
+        orch._tenants = ['f266f30b11f246b589fd266f85eeec39']
+        lock = mock.MagicMock()
+        lock.acquire.return_value = True
+        with mock.patch.object(orch, '_lock', return_value=lock), \
+                mock.patch.object(orch, '_check_state', return_value=42), \
+                mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            worker_mock.return_value.run.side_effect = Exception()
+            orch._process_tenant('f266f30b11f246b589fd266f85eeec39')
+        lock.acquire.assert_called_once_with(blocking=False)
+        lock.release.assert_called_once_with()
+        self.assertEqual([], orch._tenants)
+
+    def test_heartbeat_survives_errors(self):
+        with mock.patch.object(orchestrator.Orchestrator, '__init__',
+                               return_value=None):
+            orch = orchestrator.Orchestrator()
+        orch.coord = mock.MagicMock()
+        orch.coord.heartbeat.side_effect = [Exception(), None]
+        with mock.patch.object(orchestrator.eventlet, 'sleep',
+                               side_effect=[None, StopIteration()]):
+            self.assertRaises(StopIteration, orch._heartbeat)
+        self.assertEqual(2, orch.coord.heartbeat.call_count)
+
+    def test_process_tenant_skips_locked_tenant(self):
+        with mock.patch.object(orchestrator.Orchestrator, '__init__',
+                               return_value=None):
+            orch = orchestrator.Orchestrator()
+        lock = mock.MagicMock()
+        lock.acquire.return_value = False
+        with mock.patch.object(orch, '_lock', return_value=lock), \
+                mock.patch.object(orchestrator, 'Worker') as worker_mock:
+            orch._process_tenant('f266f30b11f246b589fd266f85eeec39')
+        self.assertFalse(worker_mock.called)
+        self.assertFalse(lock.release.called)
+
+
+class WorkerTest(tests.TestCase):
+    def setUp(self):
+        super(WorkerTest, self).setUp()
+        rating_processors.processors_cache.clear()
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        patcher = mock.patch(ck_ext_mgr)
+        stevemock = patcher.start()
+        self.addCleanup(patcher.stop)
+        stevemock.return_value = extension.ExtensionManager.make_test_instance(
+            [],
+            'cloudkitty.rating.processors')
+        self.collector = mock.MagicMock()
+        self.storage = mock.MagicMock()
+        self.worker = orchestrator.Worker(self.collector,
+                                          self.storage,
+                                          'f266f30b11f246b589fd266f85eeec39')
+
+    def test_collect_services_keeps_services_order(self):
+        self.conf.set_override('services', ['compute', 'image', 'volume'],
+                               'collect')
+
+        def retrieve(service, start, end, tenant_id):
+            if service == 'image':
+                raise Exception('Collection failed')
+            return {service: [{'desc': {}, 'vol': {'qty': 1}}]}
+
+        self.collector.retrieve.side_effect = retrieve
+        results = self.worker._collect_services(0)
+        self.assertEqual(['compute', 'image', 'volume'],
+                         [service for service, data in results])
+        self.assertEqual({}, results[1][1])
+        self.assertEqual(
+            {'compute': [{'desc': {}, 'vol': {'qty': 1}}]},
+            results[0][1][0][0]['usage'])
+        self.assertEqual(
+            {'volume': [{'desc': {}, 'vol': {'qty': 1}}]},
+            results[2][1][0][0]['usage'])
+
+    @mock.patch.object(ck_utils, 'utcnow_ts', return_value=36000)
+    def test_catchup_end_is_limited_by_wait_time(self, utcnow_mock):
+        self.conf.set_override('catchup_periods', 24, 'collect')
+        # Two periods of wait time, periods starting before 28800 are ready
+        self.assertEqual(28800, self.worker.get_catchup_end(0))
+        self.conf.set_override('catchup_periods', 3, 'collect')
+        self.assertEqual(10800, self.worker.get_catchup_end(0))
+        self.conf.set_override('catchup_periods', 1, 'collect')
+        self.assertEqual(3600, self.worker.get_catchup_end(0))
+
+    def test_collect_services_in_batch(self):
+        self.conf.set_override('services', ['compute'], 'collect')
+        compute_data = {'compute': [{'desc': {}, 'vol': {'qty': 1}}]}
+        self.collector.retrieve_batch.return_value = {
+            0: compute_data,
+            7200: compute_data}
+        results = self.worker._collect_services(0, 10800)
+        self.collector.retrieve_batch.assert_called_once_with(
+            'compute',
+            0,
+            10800,
+            'f266f30b11f246b589fd266f85eeec39')
+        self.assertFalse(self.collector.retrieve.called)
+        batch = results[0][1]
+        self.assertEqual([0, 7200], sorted(batch))
+        self.assertEqual({'begin': 7200, 'end': 10800},
+                         batch[7200][0]['period'])
+
+    def test_timed_out_period_recorded_without_data(self):
+        self.conf.set_override('services', ['compute', 'image'], 'collect')
+        self.conf.set_override('service_timeout', 1, 'collect')
+        compute_data = {'compute': [{'desc': {}, 'vol': {'qty': 1}}]}
+        self.collector.retrieve_batch.side_effect = Exception()
+
+        def retrieve(service, start, end, tenant_id):
+            if service == 'image' and start == 7200:
+                orchestrator.eventlet.sleep(5)
+            return compute_data
+
+        self.collector.retrieve.side_effect = retrieve
+        with mock.patch.object(self.worker,
+                               'check_state',
+                               side_effect=[3600, 0]), \
+                mock.patch.object(self.worker,
+                                  'get_catchup_end',
+                                  return_value=14400):
+            self.worker.run()
+        self.assertEqual(3, self.storage.commit.call_count)
+        self.assertEqual(5, self.storage.append.call_count)
+        self.storage.nodata.assert_called_once_with(
+            7200,
+            10800,
+            'f266f30b11f246b589fd266f85eeec39')
+
+    def test_tenant_timing_out_makes_progress(self):
+        self.conf.set_override('services', ['compute'], 'collect')
+        self.conf.set_override('service_timeout', 1, 'collect')
+
+        def retrieve(service, start, end, tenant_id):
+            orchestrator.eventlet.sleep(5)
+
+        self.collector.retrieve.side_effect = retrieve
+        with mock.patch.object(self.worker,
+                               'check_state',
+                               side_effect=[3600, 7200, 0]), \
+                mock.patch.object(self.worker,
+                                  'get_catchup_end',
+                                  side_effect=lambda ts: ts + 3600):
+            self.worker.run()
+        self.assertEqual(2, self.storage.commit.call_count)
+        self.assertEqual(
+            [mock.call(3600, 7200, 'f266f30b11f246b589fd266f85eeec39'),
+             mock.call(7200, 10800, 'f266f30b11f246b589fd266f85eeec39')],
+            self.storage.nodata.call_args_list)
@@ -26,6 +26,7 @@ import six
 
 from cloudkitty.rating import pyscripts
 from cloudkitty.rating.pyscripts.db import api
+from cloudkitty.rating.pyscripts import pool
 from cloudkitty import tests
 
 FAKE_UUID = '6c1b8a30-797f-4b7e-ad66-9879b79059fb'
@@ -102,6 +103,43 @@ for period in data:
                         'price': decimal.Decimal(1.0)}
 """.encode('utf-8')
 
+FUNCTION_POLICY1 = """
+import decimal
+
+calls = []
+
+
+def process(data):
+    calls.append(len(data))
+    for period in data:
+        for service, resources in period['usage'].items():
+            if service == 'compute':
+                for resource in resources:
+                    if resource['desc'].get('flavor') == 'm1.nano':
+                        resource['rating'] = {
+                            'price': decimal.Decimal(1.0)}
+""".encode('utf-8')
+FUNCTION_POLICY1_CHECKSUM = hashlib.sha1(FUNCTION_POLICY1).hexdigest()
+
+CALLING_POLICY1 = """
+import decimal
+
+
+def process(data):
+    for period in data:
+        for service, resources in period['usage'].items():
+            if service == 'compute':
+                for resource in resources:
+                    if resource['desc'].get('flavor') == 'm1.nano':
+                        resource['rating'] = {
+                            'price': decimal.Decimal(1.0)}
+    return data
+
+
+data = process(data)
+""".encode('utf-8')
+CALLING_POLICY1_CHECKSUM = hashlib.sha1(CALLING_POLICY1).hexdigest()
+
 
 class PyScriptsRatingTest(tests.TestCase):
     def setUp(self):
@@ -298,6 +336,15 @@ class PyScriptsRatingTest(tests.TestCase):
             TEST_CODE2_CHECKSUM,
             self._pyscripts._scripts[policy_db.script_id]['checksum'])
 
+    def test_unchanged_scripts_not_recompiled(self):
+        policy1_db = self._db_api.create_script('policy1', TEST_CODE1)
+        self._db_api.create_script('policy2', TEST_CODE2)
+        self.assertEqual(2, self._pyscripts.load_scripts_in_memory())
+        self.assertEqual(0, self._pyscripts.load_scripts_in_memory())
+        self._db_api.update_script(policy1_db.script_id, data=TEST_CODE3)
+        self.assertEqual(1, self._pyscripts.load_scripts_in_memory())
+        self.assertEqual(3, self._pyscripts.compiled_scripts)
+
     def test_exec_code_isolation(self):
         self._db_api.create_script('policy1', TEST_CODE1)
         self._db_api.create_script('policy2', TEST_CODE3)
@@ -315,3 +362,86 @@ class PyScriptsRatingTest(tests.TestCase):
         compute_list[2]['rating'] = {'price': decimal.Decimal('1')}
         self._pyscripts.process(actual_data)
         self.assertEqual(expected_data, actual_data)
+
+    def test_process_rating_with_function(self):
+        self._db_api.create_script('policy1', FUNCTION_POLICY1)
+        self._pyscripts.reload_config()
+        expected_data = copy.deepcopy(CK_RESOURCES_DATA)
+        compute_list = expected_data[0]['usage']['compute']
+        compute_list[0]['rating'] = {'price': decimal.Decimal('1')}
+        compute_list[2]['rating'] = {'price': decimal.Decimal('1')}
+        for i in range(2):
+            actual_data = copy.deepcopy(CK_RESOURCES_DATA)
+            self._pyscripts.process(actual_data)
+            self.assertEqual(expected_data, actual_data)
+        function = self._pyscripts._functions[FUNCTION_POLICY1_CHECKSUM]
+        self.assertEqual([1, 1], function.__globals__['calls'])
+
+    def test_process_rating_with_script_calling_function(self):
+        self._db_api.create_script('policy1', CALLING_POLICY1)
+        self._db_api.create_script('policy2', FUNCTION_POLICY1)
+        self._pyscripts.reload_config()
+        self.assertNotIn(CALLING_POLICY1_CHECKSUM, self._pyscripts._functions)
+        self.assertIn(FUNCTION_POLICY1_CHECKSUM, self._pyscripts._functions)
+        actual_data = copy.deepcopy(CK_RESOURCES_DATA)
+        expected_data = copy.deepcopy(CK_RESOURCES_DATA)
+        compute_list = expected_data[0]['usage']['compute']
+        compute_list[0]['rating'] = {'price': decimal.Decimal('1')}
+        compute_list[2]['rating'] = {'price': decimal.Decimal('1')}
+        self._pyscripts.process(actual_data)
+        self.assertEqual(expected_data, actual_data)
+
+    def test_purge_old_functions(self):
+        policy_db = self._db_api.create_script('policy1', FUNCTION_POLICY1)
+        self._pyscripts.reload_config()
+        self.assertIn(FUNCTION_POLICY1_CHECKSUM, self._pyscripts._functions)
+        self._db_api.update_script(policy_db.script_id, data=TEST_CODE1)
+        self._pyscripts.reload_config()
+        self.assertEqual({}, self._pyscripts._functions)
+
+    def _enable_pool(self):
+        self.conf.set_override('process_pool_size', 1, 'pyscripts')
+        self.conf.set_override('cpu_time_limit', 1, 'pyscripts')
+        self.conf.set_override('wall_time_limit', 2, 'pyscripts')
+        self.addCleanup(setattr, pyscripts, '_POOL', None)
+        self.addCleanup(pyscripts.get_pool().stop)
+
+    def test_process_rating_in_pool(self):
+        self._enable_pool()
+        self._db_api.create_script('policy1', COMPLEX_POLICY1)
+        self._db_api.create_script('policy2', FUNCTION_POLICY1)
+        self._pyscripts.reload_config()
+        actual_data = copy.deepcopy(CK_RESOURCES_DATA)
+        expected_data = copy.deepcopy(CK_RESOURCES_DATA)
+        compute_list = expected_data[0]['usage']['compute']
+        compute_list[0]['rating'] = {'price': decimal.Decimal('1')}
+        compute_list[2]['rating'] = {'price': decimal.Decimal('1')}
+        self._pyscripts.process(actual_data)
+        self.assertEqual(expected_data, actual_data)
+
+    def test_pool_cpu_time_limit(self):
+        self._enable_pool()
+        self._db_api.create_script('policy1',
+                                   'while True: pass'.encode('utf-8'))
+        self._pyscripts.reload_config()
+        self.assertRaises(pool.ScriptTimeout,
+                          self._pyscripts.process,
+                          copy.deepcopy(CK_RESOURCES_DATA))
+
+    def test_pool_wall_time_limit(self):
+        self._enable_pool()
+        script_db = self._db_api.create_script(
+            'policy1',
+            'import time\ntime.sleep(60)'.encode('utf-8'))
+        self._pyscripts.reload_config()
+        self.assertRaises(pool.ScriptTimeout,
+                          self._pyscripts.process,
+                          copy.deepcopy(CK_RESOURCES_DATA))
+        # The blocked worker is killed, a new one processes the next data
+        self._db_api.update_script(script_db.script_id, data=COMPLEX_POLICY1)
+        self._pyscripts.reload_config()
+        actual_data = copy.deepcopy(CK_RESOURCES_DATA)
+        self._pyscripts.process(actual_data)
+        compute_list = actual_data[0]['usage']['compute']
+        self.assertEqual({'price': decimal.Decimal('1')},
+                         compute_list[0]['rating'])
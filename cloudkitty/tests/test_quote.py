@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Copyright 2016 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# @author: Stéphane Albert
+#
+import decimal
+
+import mock
+from stevedore import extension
+
+from cloudkitty.rating import processors as rating_processors
+from cloudkitty import tests
+
+
+class FakeQuoteModule(tests.FakeRatingModule):
+    def process(self, data):
+        for cur_data in data:
+            for entries in cur_data['usage'].values():
+                for entry in entries:
+                    entry['rating'] = {'price': decimal.Decimal('0.42')}
+        return data
+
+
+class QuoterTest(tests.TestCase):
+    def setUp(self):
+        super(QuoterTest, self).setUp()
+        rating_processors.processors_cache.clear()
+        fake_module = FakeQuoteModule()
+        fake_module.module_name = 'fake1'
+        fake_mgr = extension.ExtensionManager.make_test_instance(
+            [extension.Extension(
+                'fake1',
+                'cloudkitty.tests.FakeRatingModule1',
+                None,
+                fake_module)],
+            'cloudkitty.rating.processors')
+        ck_ext_mgr = 'cloudkitty.extension_manager.EnabledExtensionManager'
+        patcher = mock.patch(ck_ext_mgr, return_value=fake_mgr)
+        self.stevemock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.res_data = [{'usage': {'compute': [
+            {'desc': {'flavor': 'm1.nano'},
+             'vol': {'qty': 1, 'unit': 'instance'}},
+            {'desc': {'flavor': 'm1.tiny'},
+             'vol': {'qty': 1, 'unit': 'instance'}}]}}]
+
+    def test_quote(self):
+        quoter = rating_processors.Quoter()
+        self.assertEqual('0.84', quoter.quote(self.res_data))
+        self.stevemock.assert_called_once_with(
+            'cloudkitty.rating.processors',
+            invoke_kwds={'tenant_id': None})
+
+    def test_processors_reloaded_on_rules_version_change(self):
+        quoter = rating_processors.Quoter()
+        quoter.quote(self.res_data)
+        quoter.quote(self.res_data)
+        self.assertEqual(1, self.stevemock.call_count)
+        self.conn.get_module_info().bump_version('fake1')
+        quoter.quote(self.res_data)
+        self.assertEqual(2, self.stevemock.call_count)
@@ -136,3 +136,28 @@ class UtilsTimeCalculationsTest(unittest.TestCase):
         calc_dt = ck_utils.iso2dt(self.date_iso)
         check_dt = ck_utils.ts2dt(self.date_ts)
         self.assertEqual(calc_dt, check_dt)
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_evict_least_recently_used(self):
+        cache = ck_utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(3, cache.hits)
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, cache.evictions)
+
+    @mock.patch.object(timeutils, 'utcnow_ts')
+    def test_expired_entries(self, patch_utcnow_ts_mock):
+        patch_utcnow_ts_mock.return_value = 100
+        cache = ck_utils.LRUCache(10, ttl=10)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=60)
+        patch_utcnow_ts_mock.return_value = 120
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(2, cache.get('b'))
@@ -22,6 +22,7 @@ We're mostly using oslo_utils for time calculations but we're encapsulating it
 to ease maintenance in case of library modifications.
 """
 import calendar
+import collections
 import datetime
 import sys
 
@@ -150,3 +151,67 @@ def refresh_stevedore(namespace=None):
             del cache[namespace]
     else:
         cache.clear()
+
+
+class LRUCache(object):
+    """Least recently used cache with an optional time to live.
+
+    :param size: Maximal number of entries, 0 disables the cache.
+    :param ttl: Default time to live of the entries in seconds, None for no
+                expiration.
+    """
+
+    def __init__(self, size, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return default
+        expiration, value = entry
+        if expiration is not None and expiration <= _now():
+            self.misses += 1
+            return default
+        self._entries[key] = entry
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        """Add an entry to the cache.
+
+        :param key: Key of the entry.
+        :param value: Value of the entry.
+        :param ttl: Time to live of the entry, default to the cache one.
+        """
+        if not self.size:
+            return
+        if ttl is None:
+            ttl = self.ttl
+        expiration = _now() + ttl if ttl is not None else None
+        self._entries.pop(key, None)
+        self._entries[key] = (expiration, value)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return default
+        return entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+
+def _now():
+    return timeutils.utcnow_ts(microsecond=True)
@@ -96,9 +96,9 @@ class WriteOrchestrator(object):
         if not timeframe_end:
             timeframe_end = timeframe + self._period
         try:
-            data = self._storage.get_time_frame(timeframe,
-                                                timeframe_end,
-                                                tenant_id=self._tenant_id)
+            data = self._storage.iter_time_frames(timeframe,
+                                                  timeframe_end,
+                                                  tenant_id=self._tenant_id)
         except storage.NoTimeFrame:
             return None
         return data
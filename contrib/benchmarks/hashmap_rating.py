@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# @author: Stéphane Albert
+#
+"""Compare the HashMap item and batch rating paths.
+
+Rates 1k, 10k and 100k compute items per period against an in-memory
+SQLite database and checks that both paths return the same prices.
+"""
+import copy
+import gc
+import random
+import sys
+import time
+
+from oslo_config import cfg
+
+from cloudkitty.db import api as ck_db_api
+from cloudkitty.rating import hash
+from cloudkitty.rating.hash.db import api as hash_db_api
+
+SIZES = (1000, 10000, 100000)
+FLAVORS = ['m1.nano', 'm1.tiny', 'm1.small', 'm1.medium', 'm1.large']
+IMAGES = ['image-%d' % i for i in range(10)]
+MEMORY = ['64', '512', '2048', '4096', '8192']
+
+
+def setup_rules():
+    ck_db_api.get_instance().get_migration().upgrade('head')
+    db_api = hash_db_api.get_instance()
+    db_api.get_migration().upgrade('head')
+    service_db = db_api.create_service('compute')
+    group_db = db_api.create_group('instance_uptime')
+    db_api.create_mapping(cost='0.01',
+                          map_type='flat',
+                          service_id=service_db.service_id)
+    flavor_db = db_api.create_field(service_db.service_id, 'flavor')
+    for index, flavor in enumerate(FLAVORS):
+        db_api.create_mapping(value=flavor,
+                              cost='0.0%d' % (index + 2),
+                              map_type='flat',
+                              field_id=flavor_db.field_id,
+                              group_id=group_db.group_id)
+    image_db = db_api.create_field(service_db.service_id, 'image_id')
+    db_api.create_mapping(value=IMAGES[0],
+                          cost='1.10',
+                          map_type='rate',
+                          field_id=image_db.field_id,
+                          group_id=group_db.group_id)
+    memory_db = db_api.create_field(service_db.service_id, 'memory')
+    for level, cost in ((512, '0.15'), (4096, '0.2')):
+        db_api.create_threshold(level=level,
+                                cost=cost,
+                                map_type='flat',
+                                field_id=memory_db.field_id,
+                                group_id=group_db.group_id)
+    db_api.create_threshold(level=2,
+                            cost='0.9',
+                            map_type='rate',
+                            service_id=service_db.service_id)
+
+
+def generate_data(size):
+    items = []
+    for _i in range(size):
+        items.append({
+            'desc': {'flavor': random.choice(FLAVORS),
+                     'image_id': random.choice(IMAGES),
+                     'memory': random.choice(MEMORY)},
+            'vol': {'qty': random.randint(1, 4),
+                    'unit': 'instance'}})
+    return [{'period': {'begin': 0, 'end': 3600},
+             'usage': {'compute': items}}]
+
+
+def rate(processor, data, batch_processing):
+    cfg.CONF.set_override('batch_processing', batch_processing, 'hashmap')
+    data = copy.deepcopy(data)
+    # NOTE: Disable the garbage collector like timeit does.
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.time()
+        processor.process(data)
+        elapsed = time.time() - start
+    finally:
+        gc.enable()
+    prices = [str(item['rating']['price'])
+              for item in data[0]['usage']['compute']]
+    return elapsed, prices
+
+
+def main():
+    cfg.CONF([], project='cloudkitty')
+    cfg.CONF.set_override('connection', 'sqlite://', 'database')
+    setup_rules()
+    processor = hash.HashMap()
+    print('%8s %16s %16s' % ('items', 'item (items/s)', 'batch (items/s)'))
+    for size in SIZES:
+        data = generate_data(size)
+        item_time, item_prices = rate(processor, data, False)
+        batch_time, batch_prices = rate(processor, data, True)
+        if item_prices != batch_prices:
+            print('Prices differ for %d items.' % size)
+            return 1
+        print('%8d %16d %16d' % (size,
+                                 size / item_time,
+                                 size / batch_time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2016 Objectif Libre
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+# @author: Stéphane Albert
+#
+"""Time the SQLAlchemy storage queries with and without the frame indexes.
+
+Usage: storage_queries.py [ROWS [CONNECTION]]
+
+Fills rated_data_frames with ROWS frames (1M by default) spread over 500
+tenants and 5 resource types, then times the storage queries before and
+after dropping the rated_data_frames indexes. CONNECTION defaults to an
+in-memory SQLite database, use a file or a real database for 10M rows.
+"""
+import datetime
+import sys
+import time
+
+from oslo_config import cfg
+
+from cloudkitty import config  # noqa
+from cloudkitty import db
+from cloudkitty.storage import sqlalchemy as sql_storage
+from cloudkitty import utils as ck_utils
+
+TENANTS = ['%032x' % i for i in range(500)]
+RES_TYPES = ['compute', 'image', 'volume', 'network.bw.in', 'network.bw.out']
+START = datetime.datetime(2016, 1, 1)
+CHUNK_SIZE = 10000
+REPEAT = 5
+
+
+def generate_frames(rows):
+    period = datetime.timedelta(hours=1)
+    frames = []
+    for index in range(rows):
+        hour, rest = divmod(index, len(TENANTS) * len(RES_TYPES))
+        tenant_index, res_type_index = divmod(rest, len(RES_TYPES))
+        begin = START + hour * period
+        frames.append({'tenant_id': TENANTS[tenant_index],
+                       'begin': begin,
+                       'end': begin + period,
+                       'unit': 'instance',
+                       'qty': 1,
+                       'res_type': RES_TYPES[res_type_index],
+                       'rate': 0.42,
+                       'desc': '{"resource_id": "%d"}' % index,
+                       'resource_id': str(index)})
+        if len(frames) == CHUNK_SIZE:
+            yield frames
+            frames = []
+    if frames:
+        yield frames
+
+
+def fill(storage, rows):
+    engine = db.get_engine()
+    insert = storage.frame_model.__table__.insert()
+    for frames in generate_frames(rows):
+        engine.execute(insert, frames)
+
+
+def get_queries(storage):
+    # NOTE: The timeframe doesn't cover a full day, totals and tenants are
+    # then computed from the frames instead of the rollups.
+    begin = START + datetime.timedelta(hours=1)
+    end = START + datetime.timedelta(hours=5)
+    tenant_id = TENANTS[42]
+    return [
+        ('get_total', lambda: storage.get_total(begin, end, tenant_id)),
+        ('get_total service',
+         lambda: storage.get_total(begin, end, service='volume')),
+        ('get_tenants', lambda: storage.get_tenants(begin, end)),
+        ('get_time_frame',
+         lambda: storage.get_time_frame(ck_utils.dt2ts(begin),
+                                        ck_utils.dt2ts(end),
+                                        tenant_id=tenant_id)),
+    ]
+
+
+def time_queries(queries):
+    timings = []
+    for name, query in queries:
+        start = time.time()
+        for _i in range(REPEAT):
+            query()
+        timings.append((time.time() - start) * 1000 / REPEAT)
+    return timings
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    connection = sys.argv[2] if len(sys.argv) > 2 else 'sqlite://'
+    cfg.CONF([], project='cloudkitty')
+    cfg.CONF.set_override('connection', connection, 'database')
+    storage = sql_storage.SQLAlchemyStorage(period=3600)
+    storage.init()
+    fill(storage, rows)
+    queries = get_queries(storage)
+    indexed = time_queries(queries)
+    engine = db.get_engine()
+    for index in storage.frame_model.__table__.indexes:
+        index.drop(engine)
+    not_indexed = time_queries(queries)
+    print('%d rows' % rows)
+    print('%-20s %12s %12s' % ('query', 'no index', 'indexes'))
+    for (name, _query), before, after in zip(queries,
+                                             not_indexed,
+                                             indexed):
+        print('%-20s %9.2f ms %9.2f ms' % (name, before, after))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())